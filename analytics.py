@@ -0,0 +1,166 @@
+from functools import cached_property
+
+import numpy as np
+
+from portfolio import Portfolio
+from rate_table import RateTable
+
+class RiskAnalysis:
+    """
+    Risk and return statistics of currencies and buy-and-hold portfolios computed on (days x currencies) rate matrix.
+    Values of all evaluated portfolios are computed at once as one matrix, so ranking many allocations costs a few matrix operations.
+    """
+    DAYS_IN_YEAR = 365 #rates are given for every calendar day (weekends filled), so there are 365 returns in year
+    METRICS = ('total_return', 'annual_return', 'volatility', 'sharpe', 'max_drawdown')
+
+    def __init__(self, codes: list[str], rates: np.ndarray, risk_free_rate: float = 0.0, start_money: float = 1000) -> None:
+        self.codes = list(codes)
+        self.rates = np.asarray(rates, dtype=float) #rows -> days, columns -> currencies
+        self.risk_free_rate = risk_free_rate #yearly, 0.05 -> 5%
+        self.start_money = start_money
+        self.days = None #datetime64[D] of every row, known when built from RateTable
+
+        if self.rates.ndim != 2 or self.rates.shape[1] != len(self.codes):
+            raise ValueError(f'Rates shape {self.rates.shape} does not match {len(self.codes)} codes')
+        if len(self.rates) < 3:
+            raise ValueError('At least three days of rates are needed')
+        if not np.all(self.rates > 0): #also False for NaN
+            raise ValueError('Rates are missing for some days')
+
+    @classmethod
+    def from_table(cls, table: RateTable, codes: list[str], risk_free_rate: float = 0.0) -> 'RiskAnalysis':
+        """
+        Build analysis from columns of RateTable, every currency must have rate for every day
+        """
+        matrix = table.matrix(codes)
+        missing = [code for code, column in zip(codes, matrix.T) if np.isnan(column).any()]
+        if missing:
+            raise ValueError(f'No rates for {", ".join(missing)} from {table.days[0]} to {table.days[-1]}')
+        analysis = cls(codes, matrix, risk_free_rate)
+        analysis.days = table.days
+        return analysis
+
+    @cached_property
+    def log_returns(self) -> np.ndarray:
+        """
+        Daily log returns of every currency, rows -> days (one less than rates)
+        """
+        return np.diff(np.log(self.rates), axis=0)
+
+    @cached_property
+    def covariance(self) -> np.ndarray:
+        """
+        Covariance matrix of daily log returns
+        """
+        return np.atleast_2d(np.cov(self.log_returns, rowvar=False))
+
+    @cached_property
+    def correlation(self) -> np.ndarray:
+        """
+        Correlation matrix of daily log returns, 0 for currency which did not move at all
+        """
+        deviations = np.sqrt(np.diag(self.covariance))
+        scale = np.outer(deviations, deviations)
+        correlation = np.divide(self.covariance, scale, out=np.zeros_like(self.covariance), where=scale > 0)
+        np.fill_diagonal(correlation, 1.0)
+        return correlation
+
+    def volatility(self, totals: np.ndarray) -> np.ndarray:
+        """
+        Yearly volatility in percents of daily log returns of every column of totals
+        """
+        return np.std(np.diff(np.log(totals), axis=0), axis=0, ddof=1) * np.sqrt(self.DAYS_IN_YEAR) * 100
+
+    def totals(self, weights: np.ndarray) -> np.ndarray:
+        """
+        Buy-and-hold value of every row of weights for each day, rows -> days, columns -> weights rows
+        """
+        return Portfolio.totals_for_weights(self.rates, np.atleast_2d(weights), self.start_money)
+
+    @staticmethod
+    def max_drawdown(totals: np.ndarray) -> np.ndarray:
+        """
+        The biggest fall from previous peak in percents (negative), for every column of totals
+        """
+        peaks = np.maximum.accumulate(totals, axis=0)
+        return (totals / peaks - 1).min(axis=0) * 100
+
+    def evaluate(self, weights: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Statistics of every row of weights (shares of start money, 0.3 -> 30%) at once, each value is array with one item per row.
+        Every statistic comes from the same buy-and-hold values, weights drift with rates.
+        """
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        totals = self.totals(weights)
+
+        growth = totals[-1] / totals[0]
+        annual_return = np.log(growth) * self.DAYS_IN_YEAR / len(self.log_returns) * 100 #yearly log return
+        volatility = self.volatility(totals)
+        excess_return = annual_return - self.risk_free_rate * 100
+
+        return {
+            'total_return': (growth - 1) * 100,
+            'annual_return': annual_return,
+            'volatility': volatility,
+            'sharpe': np.divide(excess_return, volatility, out=np.zeros_like(volatility), where=volatility > 0),
+            'max_drawdown': self.max_drawdown(totals),
+        }
+
+    def rolling_returns(self, weights: np.ndarray, window: int) -> np.ndarray:
+        """
+        Return in percents of investment lasting window days, for every start day and every row of weights.
+        Rows -> start days, columns -> weights rows.
+        """
+        self._check_window(window)
+        totals = self.totals(weights)
+        return (totals[window:] / totals[:-window] - 1) * 100
+
+    def rolling_correlations(self, window: int) -> np.ndarray:
+        """
+        Correlation of daily log returns between every two currencies in window of days ending on each day,
+        shape is (days - window) x currencies x currencies. Windows are computed from cumulative sums, not one by one.
+        """
+        self._check_window(window)
+        returns = self.log_returns
+
+        def window_sums(values: np.ndarray) -> np.ndarray:
+            sums = np.cumsum(values, axis=0)
+            return np.concatenate((sums[window - 1:window], sums[window:] - sums[:-window]))
+
+        sums = window_sums(returns)
+        product_sums = window_sums(returns[:, :, np.newaxis] * returns[:, np.newaxis, :])
+        covariance = product_sums - sums[:, :, np.newaxis] * sums[:, np.newaxis, :] / window
+        variance = np.diagonal(covariance, axis1=1, axis2=2)
+        scale = np.sqrt(np.maximum(variance[:, :, np.newaxis] * variance[:, np.newaxis, :], 0))
+        correlation = np.divide(covariance, scale, out=np.zeros_like(covariance), where=scale > 1e-18)
+        return np.clip(correlation, -1, 1)
+
+    def _check_window(self, window: int) -> None:
+        if not 2 <= window <= len(self.log_returns):
+            raise ValueError(f'Window must be from 2 to {len(self.log_returns)} days')
+
+    def rank(self, weights: np.ndarray, sort_by: str = 'sharpe', window: int | None = None, limit: int | None = None) -> list[dict]:
+        """
+        Evaluate rows of weights and return them from the best one, with the worst, median and best rolling return if window is given.
+        The best means the highest value, except volatility (lowest) and max_drawdown (smallest fall).
+        """
+        if sort_by not in self.METRICS:
+            raise ValueError(f'Cannot sort by {sort_by}, choose one of {", ".join(self.METRICS)}')
+
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        statistics = self.evaluate(weights)
+        order = np.argsort(statistics[sort_by] if sort_by == 'volatility' else -statistics[sort_by], kind='stable')[:limit]
+
+        rolling = None
+        if window is not None:
+            rolling = np.percentile(self.rolling_returns(weights[order], window), [0, 50, 100], axis=0) #only ranked rows
+
+        ranking = []
+        for position, row in enumerate(order):
+            result = {'index': int(row), 'weights': dict(zip(self.codes, np.round(weights[row] * 100, 2).tolist()))}
+            result.update({metric: round(float(values[row]), 4) for metric, values in statistics.items()})
+            if rolling is not None:
+                result['rolling_return'] = {'window': window, 'worst': round(float(rolling[0, position]), 4),
+                                            'median': round(float(rolling[1, position]), 4), 'best': round(float(rolling[2, position]), 4)}
+            ranking.append(result)
+        return ranking
@@ -1,11 +1,102 @@
-from flask import Flask, render_template, request
+import time
+startup_started = time.perf_counter() #startup time is measured from first line, imports included
 
-from nbp_api import NbpApi
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import Flask, Response, abort, g, jsonify, render_template, request, stream_with_context, url_for
+
+import metrics
+
+from analytics import RiskAnalysis
+from batch import BatchAnalysis
+from chart_cache import ChartCache
+from nbp_api import NbpApi, NbpApiError
 from investment import Investment
+from job_store import JobStore
+from jobs import JobQueue, QueueFullError, run_analysis
+from portfolio import Portfolio
+from rate_store import RateStore
+from warmup import check_startup_budget, warm_up
 
 app = Flask(__name__)
 
-nbp_api = NbpApi()
+#historical rates are kept on disk, NBP_OFFLINE=1 uses only stored rates
+rate_store = RateStore(os.path.join('data', 'nbp_rates.sqlite3'))
+nbp_offline = os.environ.get('NBP_OFFLINE') == '1'
+nbp_api_url = os.environ.get('NBP_API_URL', 'https://api.nbp.pl/api/exchangerates/') #NBP_API_URL points app at local stub in benchmarks
+nbp_api = NbpApi(rate_store, offline=nbp_offline, base_url=nbp_api_url)
+
+#rendered charts shared by all requests, identical analyses do not draw again
+chart_cache = ChartCache(os.path.join('data', 'charts'))
+
+#analyses sent to /jobs run in separate processes started with first job (not in gunicorn master), ANALYSIS_WORKERS sets how many
+analysis_workers = int(os.environ.get('ANALYSIS_WORKERS') or os.cpu_count() or 1)
+job_queue = JobQueue(JobStore(os.path.join('data', 'jobs.sqlite3')), analysis_workers, max_pending=4 * analysis_workers, result_ttl=600,
+                     initargs=(rate_store.path, chart_cache.directory, nbp_api_url, nbp_offline))
+
+#charts are drawn in browser only when Chart.js is installed in static (npm install in static directory)
+client_charts_available = os.path.exists(os.path.join(app.static_folder, 'node_modules', 'chart.js', 'dist', 'chart.umd.js'))
+
+def read_chart_mode(values) -> str:
+    #'client' -> charts are drawn in browser from series data, 'png' -> server draws them
+    return 'client' if values.get('chart_mode') == 'client' and client_charts_available else 'png'
+
+#cache statistics are read when /metrics is scraped
+metrics.REGISTRY.register(metrics.Gauge('rate_store_requests', 'Rate store lookups by result (hits, misses, gap_fetches)',
+                                        lambda: {(('result', result),): value for result, value in nbp_api.cache_stats.items()}))
+metrics.REGISTRY.register(metrics.Gauge('chart_cache_requests', 'Chart cache lookups by result (hits, misses)',
+                                        lambda: {(('result', result),): value for result, value in chart_cache.stats.items()}))
+metrics.REGISTRY.register(metrics.Gauge('analysis_jobs', 'Analysis jobs waiting in queue and running',
+                                        lambda: {(('state', state),): job_queue.depth()[state] for state in ('queued', 'running')}))
+
+#APP_PRELOAD=1 prepares process before it serves requests - matplotlib import, font cache and currency list.
+#Meant for gunicorn --preload: work is done once in master process and forked workers start ready.
+#Without it matplotlib is imported on first drawn chart and currency list is downloaded in background.
+#Spawned analysis workers import this module as __mp_main__ when app is run with python app.py - they skip warm-up.
+startup_steps = {}
+if __name__ != '__mp_main__':
+    if os.environ.get('APP_PRELOAD') == '1':
+        startup_steps.update(warm_up(nbp_api))
+    else:
+        nbp_api.warm_currency_list(background=True) #index page is ready before first visit
+
+#STARTUP_BUDGET_SECONDS sets how long startup may take before warning is logged
+startup_budget = float(os.environ.get('STARTUP_BUDGET_SECONDS') or 2.0)
+startup_steps['total'] = time.perf_counter() - startup_started
+check_startup_budget(startup_steps['total'], startup_budget)
+metrics.REGISTRY.register(metrics.Gauge('app_startup_seconds', 'Time spent on application startup by step (total includes imports)',
+                                        lambda: {(('step', step),): seconds for step, seconds in startup_steps.items()}))
+
+#METRICS_TRACE=1 traces every request, otherwise only requests with X-Debug-Trace header
+trace_all_requests = os.environ.get('METRICS_TRACE') == '1'
+
+@app.before_request
+def start_request_metrics() -> None:
+    g.request_started = time.perf_counter()
+    g.trace = None
+    metrics.end_trace() #trace of previous request in this thread must not collect stages of this one
+    if trace_all_requests or request.headers.get('X-Debug-Trace'):
+        g.trace = metrics.start_trace()
+
+@app.after_request
+def finish_request_metrics(response: Response) -> Response:
+    endpoint = request.endpoint or 'unknown'
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    metrics.HTTP_REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+
+    if g.trace is not None:
+        #stage breakdown in header (visible in browser dev tools) and in log
+        response.headers['Server-Timing'] = g.trace.server_timing()
+        logging.info(f'{request.method} {request.path} stages: {response.headers["Server-Timing"]}')
+    return response
+
+@app.teardown_request
+def end_request_trace(error: BaseException | None) -> None:
+    metrics.end_trace()
 
 @app.route('/')
 def index() -> str:
@@ -13,46 +104,266 @@ def index() -> str:
     #get the list of currencies and their codes from NbpApi
     currency_list = nbp_api.get_currency_list()
     
-    return render_template('index.html', currency_list = currency_list)
+    return render_template('index.html', currency_list = currency_list, client_charts = client_charts_available)
+
+MAX_HORIZON_DAYS = BatchAnalysis.MAX_HORIZON_DAYS #the same limit for form, batch and analytics
+
+def read_analysis_form(values) -> tuple[dict[str, dict[str, str]], dict[str, str], str, int, dict]:
+    #get values from form, every currency row sends one 'currency' and one 'percentage' field
+    currencies = values.getlist('currency')
+    percentages = values.getlist('percentage')
+    if not currencies or len(currencies) != len(percentages):
+        raise ValueError('Every currency needs its percentage share')
+    if len(set(currencies)) != len(currencies):
+        raise ValueError('Currencies must be different')
+    shares = [float(percentage) for percentage in percentages] #only checked, strings from form are passed on
+    if not all(np.isfinite(share) and share > 0 for share in shares):
+        raise ValueError('Percentage shares must be positive numbers')
+    if abs(sum(shares) - 100) > 1e-6:
+        raise ValueError('Percentage shares must sum to 100')
+
+    start_date = values.get('start_date')
+    horizon_days = int(values.get('horizon_days') or 30)
+    if not 1 <= horizon_days <= MAX_HORIZON_DAYS:
+        raise ValueError(f'Horizon must be from 1 to {MAX_HORIZON_DAYS} days')
+    #NBP publishes rates for past days only, check it here so also jobs are rejected before they are queued
+    end_date = datetime.strptime(start_date or '', '%Y-%m-%d') + timedelta(days=horizon_days - 1)
+    if end_date.date() >= datetime.today().date():
+        raise ValueError(f'End date {end_date:%Y-%m-%d} is in the future')
+
+    #'daily', 'weekly', 'monthly', 'drift' (rebalance after drift_threshold percentage points) or empty for buy-and-hold
+    rebalance = values.get('rebalance') or None
+    if rebalance is not None and rebalance != 'drift' and rebalance not in Portfolio.REBALANCE_PERIODS:
+        raise ValueError(f'Unknown rebalance period {rebalance}')
+    rebalance_options = {'rebalance': rebalance, 'drift_threshold': None}
+    if rebalance == 'drift':
+        drift_threshold = float(values.get('drift_threshold') or 5)
+        if not (np.isfinite(drift_threshold) and drift_threshold > 0):
+            raise ValueError('Drift threshold must be a positive number')
+        rebalance_options = {'rebalance': None, 'drift_threshold': drift_threshold}
+
+    #build dict with currency code and its percentage share, keys keep order of rows in form
+    currency_dict = {str(position): {'currency': currency, 'percentage': percentage}
+                     for position, (currency, percentage) in enumerate(zip(currencies, percentages), start=1)}
+
+    start_values = dict(zip(currencies, percentages))
+    return currency_dict, start_values, start_date, horizon_days, rebalance_options
 
 @app.route('/analyze', methods=['POST'])
 def analyze() -> str:
-    #get values from form
-    curr_first = request.form.get('curr_first')
-    percentage_first = request.form.get('percentage_first')
-    
-    curr_second = request.form.get('curr_second')
-    percentage_second = request.form.get('percentage_second')
-    
-    curr_third = request.form.get('curr_third')
-    percentage_third = request.form.get('percentage_third')
+    try:
+        currency_dict, start_values, start_date, horizon_days, rebalance_options = read_analysis_form(request.form)
+        investment = Investment(currency_dict, start_date, nbp_api, chart_cache, horizon_days, **rebalance_options)
+        investment.rate_frame #download rates first, so missing rates are reported as bad request
+    except (TypeError, ValueError) as e:
+        abort(400, str(e))
+    except NbpApiError as e:
+        abort(502, str(e))
+    chart_mode = read_chart_mode(request.form)
+
+    return render_result(currency_dict, horizon_days, rebalance_options, investment.analyze(start_values, chart_mode))
 
-    start_date = request.form.get('start_date')
+def render_result(currency_dict: dict[str, dict[str, str]], horizon_days: int, rebalance_options: dict, result: dict) -> str:
+    return render_template('investmentResult.html', 
+                           last_total = result['last_total'], 
+                           bilance = result['bilance'], 
+                           highest_value = result['highest_value'], 
+                           best_date = result['best_date'], 
+                           best_bilance = result['best_bilance'], 
+                           currencies = list(currency_dict.values()),
+                           rebalance = rebalance_options['rebalance'],
+                           drift_threshold = rebalance_options['drift_threshold'],
+                           horizon_days = horizon_days,
+                           risk = result.get('risk'),
+                           chart_files = result['chart_files'],
+                           series = result['series'])
 
-    #build dict with currency code and its percentage share
-    currency_dict = {
-        'first': {'currency': curr_first, 'percentage': percentage_first},
-        'second': {'currency': curr_second, 'percentage': percentage_second},
-        'third': {'currency': curr_third, 'percentage': percentage_third},
+@app.route('/series', methods=['GET', 'POST'])
+def series() -> Response:
+    #numbers behind all charts as JSON, takes the same fields as analyze form
+    try:
+        currency_dict, start_values, start_date, horizon_days, rebalance_options = read_analysis_form(request.values)
+        investment = Investment(currency_dict, start_date, nbp_api, chart_cache, horizon_days, **rebalance_options)
+        return jsonify(investment.series_data(start_values))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except NbpApiError as e:
+        return jsonify({'error': str(e)}), 502
+
+@app.route('/jobs', methods=['POST'])
+def submit_job() -> Response:
+    #the same fields as analyze form, analysis runs in worker process and client polls for result
+    try:
+        currency_dict, start_values, start_date, horizon_days, rebalance_options = read_analysis_form(request.values)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    chart_mode = read_chart_mode(request.values)
+
+    try:
+        job_id = job_queue.submit(run_analysis, currency_dict, start_values, start_date, horizon_days, chart_mode, rebalance_options,
+                                  meta={'currency_dict': currency_dict, 'horizon_days': horizon_days, 'rebalance_options': rebalance_options})
+    except QueueFullError as e:
+        response = jsonify({'error': str(e), 'queue': job_queue.depth()})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    response = jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id),
+                        'result_url': url_for('job_result', job_id=job_id), 'queue': job_queue.depth()})
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job_id)
+    return response
+
+@app.route('/jobs', methods=['GET'])
+def job_queue_depth() -> Response:
+    return jsonify(job_queue.depth())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id: str) -> Response:
+    status = job_queue.get(job_id)
+    if status is None:
+        abort(404)
+    status.pop('meta')
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id: str) -> Response | str:
+    #result page of finished job, while job is not finished its status is returned
+    status = job_queue.get(job_id)
+    if status is None:
+        abort(404)
+    if status['status'] == 'failed':
+        return jsonify({'status': 'failed', 'error': status['error']}), 500
+    if status['status'] != 'done':
+        response = jsonify({'status': status['status']})
+        response.status_code = 202
+        response.headers['Retry-After'] = '1'
+        return response
+
+    meta = status['meta']
+    return render_result(meta['currency_dict'], meta['horizon_days'], meta['rebalance_options'], status['result'])
+
+@app.route('/batch', methods=['POST'])
+def batch() -> Response:
+    #evaluate list of scenarios without charts, results are streamed as one JSON object per line
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return Response(json.dumps({'error': 'Request body must be a JSON object'}), status=400, mimetype='application/json')
+
+    try:
+        batch_analysis = BatchAnalysis(payload.get('scenarios', []), nbp_api)
+        batch_analysis.load_rates()
+    except (TypeError, ValueError) as e:
+        return Response(json.dumps({'error': str(e)}), status=400, mimetype='application/json')
+    except NbpApiError as e:
+        return Response(json.dumps({'error': str(e)}), status=502, mimetype='application/json')
+
+    def generate():
+        for result in batch_analysis.results():
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+MAX_ANALYTICS_PORTFOLIOS = 10000
+MAX_ANALYTICS_VALUES = 5_000_000 #days x portfolios, every (days x portfolios) float array takes 40 MB at most
+
+def read_analytics_request(payload: dict) -> tuple[list[str], str, str, np.ndarray, dict]:
+    #currencies, date range, candidate weights in percents (equal weights if not given) and ranking options
+    codes = [str(code).upper() for code in payload.get('codes', [])]
+    if not codes or len(set(codes)) != len(codes):
+        raise ValueError('Give list of different currency codes')
+
+    start_date = payload.get('start_date', '')
+    if payload.get('end_date'):
+        end_date = payload['end_date']
+        days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+    else:
+        days = int(payload.get('horizon', 365))
+    if not 1 <= days <= MAX_HORIZON_DAYS:
+        raise ValueError(f'Date range must be from 1 to {MAX_HORIZON_DAYS} days')
+    end_date = (datetime.strptime(start_date, '%Y-%m-%d') + timedelta(days=days - 1)).strftime('%Y-%m-%d')
+
+    weights = np.array(payload.get('weights') or [[100 / len(codes)] * len(codes)], dtype=float)
+    if weights.ndim != 2 or weights.shape[1] != len(codes):
+        raise ValueError('Every row of weights needs one weight for each currency')
+    if len(weights) > MAX_ANALYTICS_PORTFOLIOS:
+        raise ValueError(f'Too many portfolios, maximum is {MAX_ANALYTICS_PORTFOLIOS}')
+    if len(weights) * days > MAX_ANALYTICS_VALUES:
+        raise ValueError(f'Too many portfolios for {days} days, maximum is {MAX_ANALYTICS_VALUES // days}')
+    if not np.all(np.isfinite(weights)) or np.any(np.abs(weights.sum(axis=1) - 100) > 1e-6) or np.any(weights < 0):
+        raise ValueError('Weights in every row must be non-negative numbers and sum to 100')
+
+    options = {
+        'sort_by': payload.get('sort_by', 'sharpe'),
+        'window': int(payload['window']) if payload.get('window') else None, #days of rolling returns and correlations
+        'limit': int(payload.get('limit', 50)),
+        'risk_free_rate': float(payload.get('risk_free_rate', 0)) / 100, #yearly, in percents
     }
+    if options['limit'] < 1:
+        raise ValueError('Limit must be at least 1')
+    if not np.isfinite(options['risk_free_rate']):
+        raise ValueError('Risk free rate must be a number')
+    return codes, start_date, end_date, weights / 100, options
 
-    start_values = {curr_first: percentage_first, curr_second: percentage_second, curr_third: percentage_third}
-    investment = Investment(currency_dict, start_date, nbp_api)
+@app.route('/analytics', methods=['POST'])
+def analytics() -> Response:
+    #risk and return of currencies and ranking of candidate allocations over stored rate series
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
 
-    last_total, highest_value, best_date, bilance, best_bilance = investment.analyze_investment(start_values)    
-    
-    return render_template('investmentResult.html', 
-                           last_total = last_total, 
-                           bilance = bilance, 
-                           highest_value = highest_value, 
-                           best_date = best_date, 
-                           best_bilance = best_bilance, 
-                           curr_first = curr_first, 
-                           curr_second = curr_second, 
-                           curr_third = curr_third,
-                           percentage_first = percentage_first,
-                           percentage_second = percentage_second,
-                           percentage_third = percentage_third)
+    try:
+        codes, start_date, end_date, weights, options = read_analytics_request(payload)
+        with metrics.timed('fetch'):
+            table = nbp_api.get_rate_table(start_date, end_date)
+        with metrics.timed('compute'):
+            analysis = RiskAnalysis.from_table(table, codes, options['risk_free_rate'])
+            currencies = analysis.evaluate(np.eye(len(codes))) #every currency alone
+            result = {
+                'codes': codes,
+                'start_date': str(analysis.days[0]),
+                'end_date': str(analysis.days[-1]),
+                'currencies': {code: {metric: round(float(values[index]), 4) for metric, values in currencies.items()}
+                               for index, code in enumerate(codes)},
+                'correlation': np.round(analysis.correlation, 4).tolist(),
+                'portfolios': analysis.rank(weights, options['sort_by'], options['window'], options['limit']),
+            }
+
+            if options['window'] is not None and len(codes) > 1:
+                rolling = analysis.rolling_correlations(options['window'])
+                pairs = [(first, second) for first in range(len(codes)) for second in range(first + 1, len(codes))]
+                result['rolling_correlation'] = {
+                    'window': options['window'],
+                    'dates': analysis.days[options['window']:].astype(str).tolist(), #last day of every window
+                    'pairs': {f'{codes[first]}/{codes[second]}': np.round(rolling[:, first, second], 4).tolist() for first, second in pairs},
+                }
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except NbpApiError as e:
+        return jsonify({'error': str(e)}), 502
+
+    return jsonify(result)
+
+@app.route('/charts/<chart_id>.png')
+def chart(chart_id: str) -> Response:
+    #chart id is made from analysis parameters and rates, so content under given id never changes
+    if not chart_cache.is_valid_key(chart_id):
+        abort(404)
+
+    content = chart_cache.get(chart_id)
+    if content is None:
+        abort(404)
+
+    response = Response(content, mimetype='image/png')
+    response.set_etag(chart_id)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def metrics_endpoint() -> Response:
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,130 @@
+from datetime import date, timedelta
+from typing import Iterator
+
+import numpy as np
+
+from portfolio import Portfolio
+
+class BatchAnalysis:
+    """
+    Evaluate many investment scenarios at once, without charts.
+    Whole NBP tables are downloaded once for dates of all scenarios and scenarios with the same currencies,
+    start date and horizon are computed together as one matrix operation.
+    """
+    MAX_SCENARIOS = 10000
+    MAX_HORIZON_DAYS = 3650 #the same limit as for single analysis
+    MAX_SPAN_DAYS = 2 * MAX_HORIZON_DAYS #from first start date to last end date of all scenarios, all of it is downloaded
+
+    def __init__(self, scenarios: list[dict], nbp_api, start_money: float = 1000) -> None:
+        self.nbp_api = nbp_api
+        self.start_money = start_money
+        if not isinstance(scenarios, list):
+            raise ValueError('Scenarios must be given as a list')
+        self.scenarios = [self._parse_scenario(scenario) for scenario in scenarios]
+
+        if not self.scenarios:
+            raise ValueError('No scenarios given')
+        if len(self.scenarios) > self.MAX_SCENARIOS:
+            raise ValueError(f'Too many scenarios, maximum is {self.MAX_SCENARIOS}')
+        first_day = min(scenario['start_date'] for scenario in self.scenarios)
+        last_day = max(scenario['start_date'] + timedelta(days=scenario['horizon'] - 1) for scenario in self.scenarios)
+        if (last_day - first_day).days + 1 > self.MAX_SPAN_DAYS:
+            raise ValueError(f'Scenarios must fit in {self.MAX_SPAN_DAYS} days from the first start date to the last end date')
+
+        self._first_day = None
+        self._rates = {} #currency code -> mid value for each day from first day, NaN if NBP has no rate
+
+    def _parse_scenario(self, scenario: dict) -> dict:
+        """
+        Check scenario and bring it to one format: codes, weights in percents, start date, horizon in days
+        and optional rebalancing ('daily', 'weekly', 'monthly' or drift threshold in percentage points)
+        """
+        if not isinstance(scenario, dict):
+            raise ValueError('Every scenario must be an object with codes, weights and start_date')
+        codes = [str(code).upper() for code in scenario.get('codes', [])]
+        weights = [float(weight) for weight in scenario.get('weights', [])]
+        start_date = date.fromisoformat(scenario.get('start_date', ''))
+        horizon = int(scenario.get('horizon', 30))
+        rebalance = scenario.get('rebalance') or None
+        drift_threshold = float(scenario['drift_threshold']) if scenario.get('drift_threshold') is not None else None
+
+        if not codes or len(codes) != len(weights):
+            raise ValueError('Every scenario needs the same number of codes and weights')
+        if len(set(codes)) != len(codes):
+            raise ValueError('Currencies in scenario must be different')
+        if not all(np.isfinite(weight) and weight > 0 for weight in weights):
+            raise ValueError('Weights in scenario must be positive numbers')
+        if abs(sum(weights) - 100) > 1e-6:
+            raise ValueError('Weights in scenario must sum to 100')
+        if not 1 <= horizon <= self.MAX_HORIZON_DAYS:
+            raise ValueError(f'Horizon must be from 1 to {self.MAX_HORIZON_DAYS} days')
+        if rebalance is not None and rebalance not in Portfolio.REBALANCE_PERIODS:
+            raise ValueError(f'Unknown rebalance period {rebalance}')
+        if drift_threshold is not None and not (np.isfinite(drift_threshold) and drift_threshold > 0):
+            raise ValueError('Drift threshold must be a positive number')
+
+        return {'codes': tuple(codes), 'weights': weights, 'start_date': start_date, 'horizon': horizon,
+                'rebalance': rebalance, 'drift_threshold': drift_threshold}
+
+    def load_rates(self) -> None:
+        """
+        Download whole tables once, for range covering all scenarios, and take columns of every currency used by scenarios
+        """
+        self._first_day = min(scenario['start_date'] for scenario in self.scenarios)
+        last_day = max(scenario['start_date'] + timedelta(days=scenario['horizon'] - 1) for scenario in self.scenarios)
+        codes = sorted({code for scenario in self.scenarios for code in scenario['codes']})
+
+        #every day from first day is one row of table, so scenarios can take their rates as a slice
+        table = self.nbp_api.get_rate_table(self._first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d'))
+        for code in codes:
+            self._rates[code] = table.column(code) #NaN if NBP has no rate
+
+    def results(self) -> Iterator[dict]:
+        """
+        Evaluate scenarios and yield result for each of them, buy-and-hold scenarios with the same currencies and dates
+        are evaluated together, rebalanced ones one by one with Portfolio
+        """
+        if self._first_day is None:
+            self.load_rates()
+
+        groups = {}
+        for index, scenario in enumerate(self.scenarios):
+            key = (scenario['codes'], scenario['start_date'], scenario['horizon'], scenario['rebalance'], scenario['drift_threshold'])
+            groups.setdefault(key, []).append(index)
+
+        for (codes, start_date, horizon, rebalance, drift_threshold), indexes in groups.items():
+            offset = (start_date - self._first_day).days
+            rates = np.column_stack([self._rates[code][offset:offset + horizon] for code in codes])
+            end_date = (start_date + timedelta(days=horizon - 1)).strftime('%Y-%m-%d')
+
+            if np.isnan(rates).any():
+                for index in indexes:
+                    yield {'index': index, 'error': f'No rates for {", ".join(codes)} from {start_date} to {end_date}'}
+                continue
+
+            weights = np.array([self.scenarios[index]['weights'] for index in indexes]) * 0.01
+            if rebalance is None and drift_threshold is None:
+                totals = Portfolio.totals_for_weights(rates, weights, self.start_money) #rows -> days, columns -> scenarios
+            else:
+                dates = [start_date + timedelta(days=day) for day in range(horizon)]
+                totals = np.column_stack([Portfolio(dates, list(codes), rates, row, self.start_money, rebalance, drift_threshold).totals
+                                          for row in weights])
+            best_indexes = np.argmax(totals, axis=0)
+
+            for column, index in enumerate(indexes):
+                last_total = round(float(totals[-1, column]), 2)
+                highest_value = round(float(totals[best_indexes[column], column]), 2)
+                yield {
+                    'index': index,
+                    'codes': list(codes),
+                    'weights': self.scenarios[index]['weights'],
+                    'start_date': start_date.strftime('%Y-%m-%d'),
+                    'end_date': end_date,
+                    'rebalance': rebalance,
+                    'drift_threshold': drift_threshold,
+                    'last_total': last_total,
+                    'bilance': round(last_total - self.start_money, 2),
+                    'highest_value': highest_value,
+                    'best_date': (start_date + timedelta(days=int(best_indexes[column]))).strftime('%Y-%m-%d'),
+                    'best_bilance': round(highest_value - self.start_money, 2),
+                }
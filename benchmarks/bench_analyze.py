@@ -0,0 +1,183 @@
+"""
+Benchmark of analyze pipeline against local NBP stub - no calls to api.nbp.pl.
+
+Measures every stage (fetch, gap fill, compute, render) and /analyze route under concurrent load,
+then compares results with stored baseline:
+    python benchmarks/bench_analyze.py                  # run and compare with benchmarks/baseline.json
+    python benchmarks/bench_analyze.py --save-baseline  # run and store results as new baseline
+Exit code is 1 when any stage is slower than baseline allows and 2 when there is no baseline.
+Committed baseline.json was made with default options (stub latency 20 ms), times depend on machine -
+save new baseline on the machine which runs comparisons (e.g. CI runner) before relying on it.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.nbp_stub import start_stub
+
+CODES = ['USD', 'EUR', 'CHF']
+START_DATE = date(2024, 3, 4)
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """
+    Get p50, p90 and p99 in milliseconds
+    """
+    if len(samples) == 1:
+        return {'p50': samples[0] * 1000, 'p90': samples[0] * 1000, 'p99': samples[0] * 1000}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49] * 1000, 'p90': cuts[89] * 1000, 'p99': cuts[98] * 1000}
+
+def measure(func, iterations: int) -> dict[str, float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+def bench_stages(base_url: str, iterations: int, horizon_days: int) -> dict[str, dict[str, float]]:
+    """
+    Time every stage of single analysis separately
+    """
+    import numpy as np
+    from analytics import RiskAnalysis
+    from chart_cache import ChartCache
+    from investment import Investment
+    from nbp_api import NbpApi
+    from rate_table import RateTable
+
+    nbp_api = NbpApi(base_url=base_url)
+    start_date = START_DATE.isoformat()
+    end_date = (START_DATE + timedelta(days=horizon_days - 1)).isoformat()
+    currency_dict = {name: {'currency': code, 'percentage': percentage}
+                     for name, code, percentage in zip(('first', 'second', 'third'), CODES, ('30', '30', '40'))}
+    start_values = {code: currency_dict[name]['percentage'] for name, code in zip(('first', 'second', 'third'), CODES)}
+
+    raw_rows = nbp_api._download_tables(start_date, end_date)
+    prepared = Investment(currency_dict, start_date, nbp_api, horizon_days=horizon_days)
+    frame = prepared.rate_frame
+
+    #ranking of many candidate allocations over three years of rates
+    history = nbp_api.get_rate_table((START_DATE - timedelta(days=3 * 365)).isoformat(), start_date)
+    candidates = np.random.default_rng(0).dirichlet(np.ones(len(CODES)), size=500)
+
+    def compute() -> None:
+        investment = Investment(currency_dict, start_date, nbp_api, horizon_days=horizon_days)
+        investment._rate_frame = frame
+        investment.summarize()
+        investment.portfolio.shares
+
+    def render() -> None:
+        with tempfile.TemporaryDirectory() as directory: #empty cache - every chart is really drawn
+            investment = Investment(currency_dict, start_date, nbp_api, ChartCache(directory), horizon_days)
+            investment._rate_frame = frame
+            investment.analyze_investment(start_values)
+
+    return {
+        'fetch': measure(lambda: nbp_api.get_rate_table(start_date, end_date), iterations),
+        'gap_fill': measure(lambda: RateTable.from_rows(raw_rows, start_date, end_date), iterations),
+        'compute': measure(compute, iterations),
+        'render': measure(render, max(1, iterations // 5)),
+        'risk_rank': measure(lambda: RiskAnalysis.from_table(history, CODES).rank(candidates, window=90), iterations),
+    }
+
+def bench_route(requests_count: int, concurrency: int, horizon_days: int) -> dict[str, float]:
+    """
+    Send many /analyze requests at once through Flask test client, every request has different start date
+    """
+    import app as application
+
+    client_app = application.app
+    forms = [{'currency': CODES, 'percentage': ['30', '30', '40'], 'horizon_days': str(horizon_days),
+              'start_date': (START_DATE + timedelta(days=index)).isoformat()} for index in range(requests_count)]
+
+    def send(form: dict) -> float:
+        started = time.perf_counter()
+        response = client_app.test_client().post('/analyze', data=form)
+        if response.status_code != 200:
+            raise RuntimeError(f'/analyze answered {response.status_code}')
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, forms))
+    elapsed = time.perf_counter() - started
+
+    result = percentiles(samples)
+    result['throughput'] = requests_count / elapsed #requests per second
+    return result
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta: float = 0.0) -> list[str]:
+    """
+    Get list of metrics which are worse than baseline by more than tolerance,
+    times must also be worse by more than min_delta ms (sub-millisecond stages are mostly noise).
+    p99 is only reported - with tens of runs it is decided by one slowest run.
+    """
+    regressions = []
+    for stage, metrics in results.items():
+        for metric, value in metrics.items():
+            old_value = baseline.get(stage, {}).get(metric)
+            if old_value is None or metric == 'p99':
+                continue
+            if metric == 'throughput':
+                worse = value < old_value * (1 - tolerance)
+            else:
+                worse = value > old_value * (1 + tolerance) + min_delta
+            if worse:
+                regressions.append(f'{stage}.{metric}: {old_value:.2f} -> {value:.2f}')
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50, help='runs of every stage')
+    parser.add_argument('--requests', type=int, default=40, help='number of /analyze requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='parallel /analyze requests')
+    parser.add_argument('--horizon', type=int, default=30, help='investment length in days')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added by stub to every answer')
+    parser.add_argument('--baseline', default=os.path.join(ROOT, 'benchmarks', 'baseline.json'))
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against baseline, 0.25 -> 25%%')
+    parser.add_argument('--min-delta', type=float, default=1.0, help='allowed slowdown in ms on top of tolerance')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    if not args.save_baseline and not os.path.exists(args.baseline): #check before long run, missing baseline must not pass as no regression
+        print(f'No baseline in {args.baseline} to compare with, run with --save-baseline first')
+        return 2
+
+    server, base_url = start_stub(args.latency)
+    os.environ['NBP_API_URL'] = base_url
+
+    with tempfile.TemporaryDirectory() as work_directory:
+        os.chdir(work_directory) #rate store and charts of the app go to temporary directory
+        results = bench_stages(base_url, args.iterations, args.horizon)
+        results['analyze_route'] = bench_route(args.requests, args.concurrency, args.horizon)
+        os.chdir(ROOT)
+    server.shutdown()
+
+    for stage, metrics in results.items():
+        print(f'{stage:>14}: ' + '  '.join(f'{metric} {value:8.2f}' for metric, value in metrics.items()))
+    print('(times in ms, throughput in requests/s)')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance, args.min_delta)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of forward fill (RateTable.from_rows) on multi-year ranges of whole table A.
+
+Compares one-pass fill of all currencies with the previous day-by-day fill repeated for every currency:
+    python benchmarks/bench_fill_missing_dates.py
+"""
+import os
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_table import RateTable
+
+CODES = [f'C{index:02d}' for index in range(33)] #table A has about 33 currencies
+
+def legacy_fill_missing_dates(data: list[dict], start_date: str, end_date: str) -> list[dict]:
+    """
+    Previous implementation for one currency - strftime for every day, weekend backtrack loop and strptime filter at the end
+    """
+    data_dict = {entry['effectiveDate']: entry['mid'] for entry in data}
+    complete_data = []
+    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+    last_mid = None
+
+    current_date = start_date_obj
+    while current_date <= end_date_obj:
+        date_str = current_date.strftime('%Y-%m-%d')
+        if date_str in data_dict:
+            last_mid = data_dict[date_str]
+            complete_data.append({'effectiveDate': date_str, 'mid': last_mid})
+        else:
+            if current_date.weekday() < 5:
+                if last_mid is not None:
+                    complete_data.append({'effectiveDate': date_str, 'mid': last_mid})
+            else:
+                backtrack_date = current_date
+                while backtrack_date.weekday() >= 5:
+                    backtrack_date -= timedelta(days=1)
+                backtrack_date_str = backtrack_date.strftime('%Y-%m-%d')
+                if backtrack_date_str in data_dict:
+                    last_mid = data_dict[backtrack_date_str]
+                    complete_data.append({'effectiveDate': date_str, 'mid': last_mid})
+        current_date += timedelta(days=1)
+
+    return [entry for entry in complete_data
+            if start_date_obj <= datetime.strptime(entry['effectiveDate'], '%Y-%m-%d').date() <= end_date_obj]
+
+def legacy_fill_tables(rows: list[dict], start_date: str, end_date: str) -> dict[str, list[dict]]:
+    """
+    Previous way of filling whole table - rows split by currency and every currency filled on its own
+    """
+    by_code = {}
+    for row in rows:
+        by_code.setdefault(row['code'], []).append({'effectiveDate': row['effectiveDate'], 'mid': row['mid']})
+    return {code: legacy_fill_missing_dates(data, start_date, end_date) for code, data in by_code.items()}
+
+def table_rows(start: date, end: date) -> list[dict]:
+    """
+    Fake tables from API - rate of every currency for every working day
+    """
+    rows = []
+    current = start
+    while current <= end:
+        if current.weekday() < 5:
+            rows.extend({'effectiveDate': current.isoformat(), 'code': code, 'mid': 1 + index + (current.toordinal() % 100) / 1000}
+                        for index, code in enumerate(CODES))
+        current += timedelta(days=1)
+    return rows
+
+def check_same(table: RateTable, legacy: dict[str, list[dict]]) -> None:
+    """
+    Both fills give the same rate for every day filled by legacy one, and legacy one fills every day which is not NaN
+    """
+    for code, filled in legacy.items():
+        column = table.column(code)
+        offsets = (np.array([entry['effectiveDate'] for entry in filled], dtype='datetime64[D]') - table.days[0]).astype(int)
+        assert np.array_equal(column[offsets], [entry['mid'] for entry in filled])
+        assert len(filled) == np.count_nonzero(~np.isnan(column))
+
+def main() -> None:
+    end = date(2024, 9, 30)
+
+    print(f'{"years":>5} {"days":>6} {"legacy ms":>10} {"from_rows ms":>13} {"speedup":>8}')
+    for years in (1, 3, 10):
+        start = end - timedelta(days=365 * years)
+        rows = table_rows(start, end)
+        args = (rows, start.isoformat(), end.isoformat())
+
+        check_same(RateTable.from_rows(*args), legacy_fill_tables(*args))
+
+        repeat = 5 if years == 10 else 10
+        legacy = min(timeit.repeat(lambda: legacy_fill_tables(*args), number=1, repeat=repeat)) * 1000
+        current = min(timeit.repeat(lambda: RateTable.from_rows(*args), number=1, repeat=repeat)) * 1000
+
+        print(f'{years:>5} {(end - start).days + 1:>6} {legacy:>10.2f} {current:>13.2f} {legacy / current:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
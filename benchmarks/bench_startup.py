@@ -0,0 +1,68 @@
+"""
+Benchmark of application startup against local NBP stub - every run is a new Python process, like new worker.
+
+Measures time until app is imported and until first / and /analyze answers, with and without APP_PRELOAD,
+then checks that import stays within startup budget:
+    python benchmarks/bench_startup.py               # budget 2 s
+    python benchmarks/bench_startup.py --budget 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.nbp_stub import start_stub
+
+#runs in new process: imports app and sends first requests, prints times in seconds as JSON
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter() - started
+client = app.app.test_client()
+client.get('/')
+index = time.perf_counter() - started
+client.post('/analyze', data={{'currency': ['USD', 'EUR', 'CHF'], 'percentage': ['30', '30', '40'], 'start_date': '2024-03-04'}})
+analyze = time.perf_counter() - started
+print(json.dumps({{'import': imported, 'first_index': index, 'first_analyze': analyze}}))
+'''
+
+def run_probe(base_url: str, preload: bool) -> dict:
+    environment = dict(os.environ, NBP_API_URL=base_url, APP_PRELOAD='1' if preload else '0')
+    with tempfile.TemporaryDirectory() as work_directory: #empty rate store and chart cache, like new worker on new machine
+        output = subprocess.run([sys.executable, '-c', PROBE.format(root=ROOT)], cwd=work_directory, env=environment,
+                                capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='number of started processes for each mode')
+    parser.add_argument('--budget', type=float, default=2.0, help='allowed seconds until app is imported (median)')
+    args = parser.parse_args()
+
+    server, base_url = start_stub()
+    results = {}
+    for preload in (False, True):
+        samples = [run_probe(base_url, preload) for _ in range(args.runs)]
+        results['preload' if preload else 'lazy'] = {metric: statistics.median(sample[metric] for sample in samples) * 1000
+                                                     for metric in ('import', 'first_index', 'first_analyze')}
+    server.shutdown()
+
+    for mode, metrics in results.items():
+        print(f'{mode:>8}: ' + '  '.join(f'{metric} {value:8.1f}' for metric, value in metrics.items()))
+    print('(median times in ms from process start)')
+
+    if results['lazy']['import'] > args.budget * 1000:
+        print(f'OVER BUDGET import takes {results["lazy"]["import"]:.1f} ms, budget is {args.budget * 1000:.0f} ms')
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
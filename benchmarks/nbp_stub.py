@@ -0,0 +1,90 @@
+"""
+Local fake of NBP API for benchmarks - answers the same URLs as api.nbp.pl with generated, repeatable rates.
+"""
+import json
+import math
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CURRENCIES = {
+    'USD': 'dolar amerykański', 'EUR': 'euro', 'CHF': 'frank szwajcarski', 'GBP': 'funt szterling',
+    'JPY': 'jen (Japonia)', 'NOK': 'korona norweska', 'SEK': 'korona szwedzka', 'CZK': 'korona czeska',
+}
+
+def mid_rate(code: str, day: date) -> float:
+    """
+    Repeatable rate of currency on given day
+    """
+    base = 1 + list(CURRENCIES).index(code)
+    return round(base + 0.05 * math.sin(day.toordinal() / 7 + base), 4)
+
+def working_days(start: date, end: date) -> list[date]:
+    days = []
+    current = start
+    while current <= end:
+        if current.weekday() < 5:
+            days.append(current)
+        current += timedelta(days=1)
+    return days
+
+class NbpStubHandler(BaseHTTPRequestHandler):
+    latency = 0.0 #seconds added to every answer, to simulate network
+
+    def do_GET(self) -> None:
+        time.sleep(self.latency)
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+
+        try:
+            body = self._answer(parts[parts.index('exchangerates') + 1:])
+        except (ValueError, IndexError, KeyError):
+            body = None
+
+        if not body:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _answer(self, parts: list[str]) -> dict | list | None:
+        """
+        Build answer for rates/A/{code}/{start}/{end} and tables/A/[{start}/{end}]
+        """
+        if parts[0] == 'rates':
+            code = parts[2].upper()
+            days = working_days(date.fromisoformat(parts[3]), date.fromisoformat(parts[4]))
+            if not days or code not in CURRENCIES:
+                return None
+            rates = [{'no': f'{index:03d}/A/NBP', 'effectiveDate': day.isoformat(), 'mid': mid_rate(code, day)} for index, day in enumerate(days)]
+            return {'table': 'A', 'currency': CURRENCIES[code], 'code': code, 'rates': rates}
+
+        if parts[0] == 'tables':
+            if len(parts) >= 4:
+                days = working_days(date.fromisoformat(parts[2]), date.fromisoformat(parts[3]))
+            else:
+                days = working_days(date.today() - timedelta(days=7), date.today() - timedelta(days=1))[-1:]
+            return [{'table': 'A', 'no': f'{index:03d}/A/NBP', 'effectiveDate': day.isoformat(),
+                     'rates': [{'currency': name, 'code': code, 'mid': mid_rate(code, day)} for code, name in CURRENCIES.items()]}
+                    for index, day in enumerate(days)]
+
+        return None
+
+    def log_message(self, format: str, *args) -> None:
+        pass #keep benchmark output clean
+
+def start_stub(latency: float = 0.0) -> tuple[ThreadingHTTPServer, str]:
+    """
+    Start stub in background thread, returns server and base url for NbpApi
+    """
+    handler = type('NbpStub', (NbpStubHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/api/exchangerates/'
@@ -0,0 +1,130 @@
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+class ChartCache:
+    """
+    Cache for rendered charts, kept in memory and on disk.
+    Both levels drop least recently used charts when they grow over their size limit.
+    """
+    KEY_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+    def __init__(self, directory: str, max_memory_bytes: int = 32 * 1024 * 1024, max_disk_bytes: int = 256 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {'hits': 0, 'misses': 0}
+        self._memory: OrderedDict[str, bytes] = OrderedDict() #oldest used chart first
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.directory): #if no cache dir - make one
+            os.makedirs(self.directory, exist_ok=True)
+
+        self._disk_size = sum(os.path.getsize(path) for path in self._disk_files())
+
+    def is_valid_key(self, key: str) -> bool:
+        """
+        Check if key can be cache key, protects from paths like ../
+        """
+        return bool(self.KEY_PATTERN.fullmatch(key))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.png')
+
+    def _disk_files(self) -> list[str]:
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                if name.endswith('.png') and self.is_valid_key(name[:-4])]
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._memory:
+                self.stats['hits'] += 1
+                return True
+
+        found = os.path.exists(self._path(key))
+        with self._lock:
+            self.stats['hits' if found else 'misses'] += 1
+        return found
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Get chart from memory or disk, None if chart is not cached
+        """
+        with self._lock:
+            content = self._memory.get(key)
+            if content is not None:
+                self._memory.move_to_end(key) #mark as recently used
+                self.stats['hits'] += 1
+                return content
+
+        try:
+            with open(self._path(key), 'rb') as chart_file:
+                content = chart_file.read()
+            os.utime(self._path(key)) #modification time is used as last access time for disk eviction
+        except FileNotFoundError:
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self.stats['hits'] += 1
+            self._remember(key, content)
+        return content
+
+    def put(self, key: str, content: bytes) -> None:
+        """
+        Save chart in memory and on disk
+        """
+        path = self._path(key)
+        is_new = not os.path.exists(path)
+
+        #write to temporary file and rename, so nobody reads half written chart
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._remember(key, content)
+            if is_new:
+                self._disk_size += len(content)
+                if self._disk_size > self.max_disk_bytes:
+                    self._evict_disk()
+
+    def _remember(self, key: str, content: bytes) -> None:
+        """
+        Put chart in memory and drop least recently used charts over memory limit, must be called with lock
+        """
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = content
+        self._memory_size += len(content)
+
+        while self._memory_size > self.max_memory_bytes and len(self._memory) > 1:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_size -= len(dropped)
+
+    def _evict_disk(self) -> None:
+        """
+        Delete least recently used chart files until cache fits in disk limit, must be called with lock
+        """
+        files = []
+        for path in self._disk_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        self._disk_size = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if self._disk_size <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._disk_size -= size
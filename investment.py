@@ -1,182 +1,287 @@
+import hashlib
+import json
 import os
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from functools import cached_property
+from io import BytesIO
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping
+import numpy as np
+
+import metrics
+from analytics import RiskAnalysis
+from chart_cache import ChartCache
+from portfolio import Portfolio
+from rate_table import RateTable
+
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+
+def load_plotting():
+    """
+    Import matplotlib on first drawn chart, so pages and answers without charts do not pay for its import.
+    Returns Figure class and matplotlib.dates module.
+    """
+    import matplotlib.dates as mdates
+    from matplotlib.figure import Figure #every chart has its own Figure, pyplot global state is not thread safe
+    return Figure, mdates
+
+@dataclass(frozen=True)
+class RateFrame:
+    """
+    Immutable rates for one analysis - shared dates and one column of mid values per currency code
+    """
+    dates: tuple[datetime, ...]
+    rates: Mapping[str, tuple[float, ...]]
+
+    @classmethod
+    def from_table(cls, table: RateTable, codes: list[str]) -> 'RateFrame':
+        """
+        Build frame from columns of RateTable, only days with rate of every currency are kept
+        """
+        matrix = table.matrix(codes)
+        complete = ~np.isnan(matrix).any(axis=1)
+        dates = tuple(table.days[complete].astype('datetime64[s]').tolist()) #datetime64 -> datetime
+        rates = {code: tuple(matrix[complete, index].tolist()) for index, code in enumerate(codes)}
+        return cls(dates, MappingProxyType(rates))
+
+    @cached_property
+    def version(self) -> str:
+        """
+        Hash of all rates in frame, changes when NBP data for analysis changes
+        """
+        content = [[date.strftime('%Y-%m-%d') for date in self.dates], sorted(self.rates.items())]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
 
-matplotlib.use('Agg') #not a windowed application, must set this to generate graphs
+    def column(self, code: str) -> tuple[float, ...]:
+        """
+        Get mid values of one currency
+        """
+        return self.rates[code]
+
+    def matrix(self, codes: list[str]) -> np.ndarray:
+        """
+        Get (days x currencies) array of mid values, columns in order of codes
+        """
+        return np.array([self.rates[code] for code in codes], dtype=float).T.reshape(len(self.dates), len(codes))
 
 class Investment():
-    def __init__(self, currency_dict: dict[str, dict[str, str]], start_date: str, nbp_api):
+    LINE_COLORS = ('r', 'g', 'b') #color of first currencies on line charts, next ones get matplotlib default colors
+    def __init__(self, currency_dict: dict[str, dict[str, str]], start_date: str, nbp_api, chart_cache: ChartCache | None = None, horizon_days: int = 30,
+                 rebalance: str | None = None, drift_threshold: float | None = None):
         self.start_date = start_date
         self.nbp_api = nbp_api
         self.start_money = 1000
-        self.first_currency_dict = currency_dict.get('first')
-        self.second_currency_dict = currency_dict.get('second')
-        self.third_currency_dict = currency_dict.get('third')
-        self.end_date = (datetime.strptime(self.start_date, '%Y-%m-%d') + timedelta(days=29)).strftime('%Y-%m-%d') #days=29 because start date + 29days = 30 days
+        self.currency_dicts = list(currency_dict.values()) #any number of {'currency': code, 'percentage': percent}, in order of form
+        self.rebalance = rebalance #'daily', 'weekly', 'monthly' or None for buy-and-hold
+        self.drift_threshold = drift_threshold #rebalance when share moves this many percentage points from target
+        self.horizon_days = horizon_days #how many days investment lasts, start date included
+        self.end_date = (datetime.strptime(self.start_date, '%Y-%m-%d') + timedelta(days=horizon_days - 1)).strftime('%Y-%m-%d') #-1 because start date + 29days = 30 days
         self.graph_directory = os.path.join('static', 'graphs') #set path to graphs
-        self.value_for_first = []
-        self.value_for_second = []
-        self.value_for_third = []
-        self.total_value = []
+        self.chart_cache = chart_cache if chart_cache is not None else ChartCache(self.graph_directory)
+        self.chart_files = {} #chart name -> key of rendered chart in chart cache
+        self.upstream_calls = 0 #HTTP requests to NBP API made for this analysis (retries included), 0 when rates came from store
+        self._rate_frame = None
+        self._portfolio = None
 
-    def _get_currency_rates(self) -> tuple[list[dict[str, float]], list[dict[str, float]], list[dict[str, float]]]:
+    def _get_rate_table(self) -> RateTable:
         """
-        Get rates for each currency from NbpApi
+        Get rates of all currencies from NbpApi, whole tables are downloaded so number of currencies does not matter
         """
-        #first currency
-        first_currency = self.nbp_api.get_currency_rates(self.first_currency_dict.get('currency'), self.start_date, self.end_date)
+        with metrics.timed('fetch'), metrics.count_upstream_calls() as upstream_calls:
+            table = self.nbp_api.get_rate_table(self.start_date, self.end_date)
+        self.upstream_calls += upstream_calls.count
 
-        #second currency
-        second_currency = self.nbp_api.get_currency_rates(self.second_currency_dict.get('currency'), self.start_date, self.end_date)
+        return table
 
-        #third currency
-        third_currency = self.nbp_api.get_currency_rates(self.third_currency_dict.get('currency'), self.start_date, self.end_date)
+    def _get_currency_codes(self) -> list[str]:
+        """
+        Get code of each currency in the investment
+        """
+        return [currency_dict.get('currency') for currency_dict in self.currency_dicts]
 
-        return first_currency, second_currency, third_currency
+    @property
+    def rate_frame(self) -> RateFrame:
+        """
+        Rates for whole analysis, downloaded only on first use, ValueError when some day has no rate
+        """
+        if self._rate_frame is None:
+            table = self._get_rate_table()
+            codes = self._get_currency_codes()
+            missing = [code for code, column in zip(codes, table.matrix(codes).T) if np.isnan(column).any()]
+            if missing: #unknown currency or hole in NBP data - analysis would be made up
+                raise ValueError(f'No rates for {", ".join(missing)} from {self.start_date} to {self.end_date}')
+            self._rate_frame = RateFrame.from_table(table, codes)
+        return self._rate_frame
+
+    @property
+    def portfolio(self) -> Portfolio:
+        """
+        Values of investment computed on rates of whole analysis
+        """
+        if self._portfolio is None:
+            codes = self._get_currency_codes()
+            weights = [float(percent) * 0.01 for percent in self._get_currency_percentage()]
+            self._portfolio = Portfolio(list(self.rate_frame.dates), codes, self.rate_frame.matrix(codes), weights, self.start_money,
+                                        self.rebalance, self.drift_threshold)
+        return self._portfolio
     
-    def _get_currency_percentage(self) -> tuple[float, float, float]:
+    def _get_currency_percentage(self) -> list[str]:
         """
         Get percentage share for each currency
         """
-        first_percent = self.first_currency_dict.get('percentage')
-
-        second_percent = self.second_currency_dict.get('percentage')
+        return [currency_dict.get('percentage') for currency_dict in self.currency_dicts]
 
-        third_percent = self.third_currency_dict.get('percentage')
-
-        return first_percent, second_percent, third_percent
-    
-    def _get_dates_and_mid(self) -> tuple[list[datetime], list[float], list[float], list[float]]:
+    def _line_color(self, index: int) -> str:
         """
-        Get dates and values for each currency
+        Get color of currency line on charts
         """
-        first_currency, second_currency, third_currency = self._get_currency_rates()
-        
-        dates = []
-        first_rate_value = []
-        second_rate_value = []
-        third_rate_value = []
-
-        for first, second, third in zip(first_currency, second_currency, third_currency):
-            dates.append(datetime.strptime(first.get('effectiveDate'), '%Y-%m-%d'))
-            first_rate_value.append(first.get('mid'))
-            second_rate_value.append(second.get('mid'))
-            third_rate_value.append(third.get('mid'))
-
-        return dates, first_rate_value, second_rate_value, third_rate_value
+        return self.LINE_COLORS[index] if index < len(self.LINE_COLORS) else f'C{index}'
     
     def when_to_leave(self) -> tuple[float, str]:
         """
         Calculate when user should leave investment to get the best outcome
         """
-        dates, _, _, _ = self._get_dates_and_mid() #get only dates
-
-        best_date = None
-        highest_value = 0
-
-        for date, value in zip(dates, self.total_value):
-            if value > highest_value: #if current value is better than previous higheset -> take current
-                highest_value = value
-                best_date = date
+        highest_value, best_date = self.portfolio.best_exit()
 
         highest_value = round(highest_value, 2) #round highest value
         best_date = best_date.strftime('%Y-%m-%d') #assure good format of date
 
         return highest_value, best_date
 
-    def analyze_investment(self, start_values: dict[str, float]) -> tuple[float, float, str, float, float]:
+    def summarize(self) -> tuple[float, float, str, float, float]:
         """
-        Pack all needed function to carry out analysis into one function
+        Calculate results of investment without drawing any chart
         """
-        self.draw_currency_rates()
+        self.rate_frame #download rates first, so download is not counted as compute time
 
-        last_total = self.draw_investment_pln()
-        bilance = last_total - 1000.0
-        bilance = round(bilance, 2)
+        with metrics.timed('compute'):
+            last_total = round(float(self.portfolio.totals[-1]), 2)
+            bilance = last_total - 1000.0
+            bilance = round(bilance, 2)
 
-        self.draw_start_pie(start_values)
+            highest_value, best_date = self.when_to_leave()
 
-        self.draw_end_pie()
-        highest_value, best_date = self.when_to_leave()
+            best_bilance = round((highest_value - 1000), 2)
 
-        best_bilance = round((highest_value - 1000), 2)
+        return last_total, highest_value, best_date, bilance, best_bilance
 
-        self.plot_currency_allocation_over_time()
+    def risk_summary(self) -> dict[str, float] | None:
+        """
+        Calculate volatility, maximum drawdown and Sharpe-like ratio of investment from its daily values,
+        None when investment is too short to measure risk
+        """
+        totals = self.portfolio.totals
+        if len(totals) < 3:
+            return None
 
-        return last_total, highest_value, best_date, bilance, best_bilance
+        #whole portfolio is treated as one asset, so statistics are exact for every rebalance strategy
+        analysis = RiskAnalysis(['portfolio'], totals[:, np.newaxis], start_money=self.start_money)
+        return {metric: round(float(values[0]), 2) for metric, values in analysis.evaluate([1.0]).items()}
+
+    def analyze_investment(self, start_values: dict[str, float]) -> tuple[float, float, str, float, float]:
+        """
+        Pack all needed function to carry out analysis into one function
+        """
+        summary = self.summarize()
+
+        with metrics.timed('render'):
+            self.draw_currency_rates()
+            self.draw_investment_pln()
+            self.draw_start_pie(start_values)
+            self.draw_end_pie()
+            self.plot_currency_allocation_over_time()
+
+        return summary
+
+    def analyze(self, start_values: dict[str, float], chart_mode: str = 'png') -> dict:
+        """
+        Carry out analysis and return results with chart keys, in 'client' mode charts are not drawn and series data is returned instead
+        """
+        series = None
+        if chart_mode == 'client':
+            series = self.series_data(start_values)
+            summary = self.summarize()
+        else:
+            summary = self.analyze_investment(start_values)
+
+        last_total, highest_value, best_date, bilance, best_bilance = summary
+        return {'last_total': last_total, 'highest_value': highest_value, 'best_date': best_date, 'bilance': bilance,
+                'best_bilance': best_bilance, 'risk': self.risk_summary(), 'chart_files': self.chart_files, 'series': series}
+
+    def series_data(self, start_values: dict[str, float]) -> dict:
+        """
+        Get all numbers needed to draw charts in browser, charts are not drawn on server
+        """
+        codes = self._get_currency_codes()
+        last_total, highest_value, best_date, bilance, best_bilance = self.summarize()
+
+        return {
+            'dates': [date.strftime('%Y-%m-%d') for date in self.rate_frame.dates],
+            'codes': codes,
+            'percentages': [float(percent) for percent in self._get_currency_percentage()],
+            'rates': {code: list(self.rate_frame.column(code)) for code in codes},
+            'values': {code: np.round(values, 2).tolist() for code, values in zip(codes, self.portfolio.values.T)},
+            'totals': np.round(self.portfolio.totals, 2).tolist(),
+            'shares': {code: np.round(shares, 2).tolist() for code, shares in zip(codes, self.portfolio.shares.T)},
+            'start_pie': {code: float(value) for code, value in start_values.items()},
+            'end_pie': dict(zip(codes, self._get_end_percentages())),
+            'rebalance': {'period': self.rebalance, 'drift_threshold': self.drift_threshold,
+                          'dates': [self.rate_frame.dates[day].strftime('%Y-%m-%d') for day in self.portfolio.rebalance_days[1:]]},
+            'summary': {'last_total': last_total, 'bilance': bilance, 'highest_value': highest_value,
+                        'best_date': best_date, 'best_bilance': best_bilance, 'risk': self.risk_summary()},
+        }
 
     def draw_start_pie(self, start_values: dict[str, float]) -> None:
         """
         Draw pie chart for percentage share of currencies in the investment at the beginning
         """
         currencies = list(start_values.keys())
-        values = list(start_values.values())
+        values = [float(value) for value in start_values.values()] #values from form are strings
         
-        self._configure_pie_chart('Procentowy podział walut na początku inwestycji', values, currencies, 'pie_chart_start.png')
+        self._configure_pie_chart('Procentowy podział walut na początku inwestycji', values, currencies, 'pie_chart_start')
 
-    def draw_end_pie(self) -> None:
+    def _get_end_percentages(self) -> list[float]:
         """
-        Draw pie chart for percentage share of currencies in the investment at the end
+        Get percentage share of each currency on the last day
         """
-        #rounded last values 
-        last_total = round(self.total_value[-1], 2)
-        last_first_value = round(self.value_for_first[-1], 2)
-        last_second_value = round(self.value_for_second[-1], 2)
-        last_third_value = round(self.value_for_third[-1], 2)
+        #rounded last values
+        last_total = round(float(self.portfolio.totals[-1]), 2)
+        last_values = np.round(self.portfolio.values[-1], 2)
 
         #calculate percentages
-        first_percentage = round(((last_first_value / last_total) * 100), 2)
-        second_percentage = round(((last_second_value / last_total) * 100), 2)
-        third_percentage = round(((last_third_value / last_total) * 100), 2)
+        percentages = np.round(last_values / last_total * 100, 2)
+        return percentages.tolist() #pack in list for drawing pie chart
 
-        currencies = [self.first_currency_dict.get('currency'), self.second_currency_dict.get('currency'), self.third_currency_dict.get('currency')] #get currencies codes
-        values = [first_percentage, second_percentage, third_percentage] #pack in array for drawing pie chart
+    def draw_end_pie(self) -> None:
+        """
+        Draw pie chart for percentage share of currencies in the investment at the end
+        """
+        currencies = self._get_currency_codes() #get currencies codes
+        values = self._get_end_percentages()
 
-        self._configure_pie_chart('Procentowy podział walut na koniec inwestycji', values, currencies, 'pie_chart_end.png')
+        self._configure_pie_chart('Procentowy podział walut na koniec inwestycji', values, currencies, 'pie_chart_end')
 
     def draw_investment_pln(self) -> float:
         """
         Draw line chart to show how investment proceeds in PLN
         """
-        first_percent, second_percent, third_percent = self._get_currency_percentage()
-
-        #calculate how much user bought with given percentages
-        first_investment_value = self.start_money * (float(first_percent)*0.01)
-        second_investment_value = self.start_money * (float(second_percent)*0.01)
-        third_investment_value = self.start_money * (float(third_percent)*0.01)
-
-        #get dates with mid value
-        dates, first_rate_values, second_rate_values, third_rate_values = self._get_dates_and_mid()
+        percents = self._get_currency_percentage()
+        dates = list(self.rate_frame.dates)
 
-        #calculate how much of currency user bought
-        first_bought = first_investment_value / first_rate_values[0] 
-        second_bought = second_investment_value / second_rate_values[0]
-        third_bought = third_investment_value / third_rate_values[0]
+        if not self._is_chart_cached('investment_in_pln'): #the same chart was rendered before - skip matplotlib
+            Figure, _ = load_plotting()
+            figure = Figure()
+            axes = figure.subplots()
+            for index, (code, percent, values) in enumerate(zip(self.portfolio.codes, percents, self.portfolio.values.T)):
+                axes.plot(dates, values, marker ='.', linestyle = '-', color = self._line_color(index), label=f"{code} {percent}%")
 
-        #change from currencies to PLN
-        for first_rate, second_rate, third_rate in zip(first_rate_values, second_rate_values, third_rate_values):
-            first_to_pln = first_bought * first_rate
-            second_to_pln = second_bought * second_rate
-            third_to_pln = third_bought * third_rate
-
-            self.value_for_first.append(first_to_pln)
-            self.value_for_second.append(second_to_pln)
-            self.value_for_third.append(third_to_pln)
-
-        #calculate sum of all currencies for each day
-        for value_first, value_second, value_third in zip(self.value_for_first, self.value_for_second, self.value_for_third):
-            self.total_value.append(value_first + value_second + value_third)
-
-        plt.plot(dates, self.value_for_first, marker ='.', linestyle = '-', color = 'r', label=f"{self.first_currency_dict.get('currency')} {first_percent}%")
-        plt.plot(dates, self.value_for_second, marker ='.', linestyle = '-', color = 'g', label=f"{self.second_currency_dict.get('currency')} {second_percent}%")
-        plt.plot(dates, self.value_for_third, marker ='.', linestyle = '-', color = 'b', label=f"{self.third_currency_dict.get('currency')} {third_percent}%")
-
-        self._configure_graph('przebieg inwestycji w PLN w ciągu inwestycji (30 dni)', 'Cena waluty', dates, 'investment_in_pln.png')
+            self._configure_graph(figure, axes, f'przebieg inwestycji w PLN w ciągu inwestycji ({self.horizon_days} dni)', 'Cena waluty', dates, 'investment_in_pln')
 
         #get total value of last day and round
-        last_total = self.total_value[-1]
+        last_total = float(self.portfolio.totals[-1])
         last_total = round(last_total, 2)
         return last_total
     
@@ -184,68 +289,90 @@ class Investment():
         """
         Draw line chart to show how much did each currency cost for each day
         """
-        dates, first_rate_value, second_rate_value, third_rate_value = self._get_dates_and_mid()
+        dates = list(self.rate_frame.dates)
 
-        plt.plot(dates, first_rate_value, marker = '.', linestyle = '-', color = 'r', label = self.first_currency_dict.get('currency'))
-        plt.plot(dates, second_rate_value, marker = '.', linestyle = '-', color = 'g', label = self.second_currency_dict.get('currency'))
-        plt.plot(dates, third_rate_value, marker = '.', linestyle = '-', color = 'b', label = self.third_currency_dict.get('currency'))
+        if not self._is_chart_cached('currency_rates'): #the same chart was rendered before - skip matplotlib
+            Figure, _ = load_plotting()
+            figure = Figure()
+            axes = figure.subplots()
+            for index, code in enumerate(self._get_currency_codes()):
+                axes.plot(dates, self.rate_frame.column(code), marker = '.', linestyle = '-', color = self._line_color(index), label = code)
 
-        self._configure_graph('Cena za wybrane waluty w ciągu inwestycji (30 dni)', 'Cena waluty', dates, 'currency_rates.png')    
+            self._configure_graph(figure, axes, f'Cena za wybrane waluty w ciągu inwestycji ({self.horizon_days} dni)', 'Cena waluty', dates, 'currency_rates')
             
-    def _configure_graph(self, title: str, ylabel: str, dates: list[datetime], file_name: str) -> None:
+    def _configure_graph(self, figure: 'Figure', axes: 'Axes', title: str, ylabel: str, dates: list[datetime], chart_name: str) -> None:
         """
         Modularize repeatable elements of code for drawing line charts
         """
-        plt.xlabel('Data')
-        plt.ylabel(ylabel)
-        plt.title(title)
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-        plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=1)) #set grid to show everyday
-        plt.xticks(rotation=90)
-        plt.xlim(dates[0], dates[-1]) #ensure that first dot starts on Y axis
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
+        axes.set_xlabel('Data')
+        axes.set_ylabel(ylabel)
+        axes.set_title(title)
+        _, mdates = load_plotting()
+        axes.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+        axes.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, len(dates) // 30))) #set grid to show everyday, on long investments about 30 days on axis
+        axes.tick_params(axis='x', labelrotation=90)
+        axes.set_xlim(dates[0], dates[-1]) #ensure that first dot starts on Y axis
+        axes.legend()
+        axes.grid(True)
+        figure.tight_layout()
+
+        self._save_chart(figure, chart_name)
+
+    def _configure_pie_chart(self, title: str, values: list[float], currencies: list[str], chart_name: str) -> None:
+        """
+        Modularize repeatable elements of code for drawing pie charts
+        """
+        if self._is_chart_cached(chart_name): #the same chart was rendered before - skip matplotlib
+            return
 
-        if not os.path.exists(self.graph_directory): #if no graph dir - make one
-            os.makedirs(self.graph_directory)
+        Figure, _ = load_plotting()
+        figure = Figure(figsize=(7, 7))
+        axes = figure.subplots()
+        axes.pie(values, labels = currencies, autopct='%1.1f%%', startangle=140) #autopct -> decimal places
+        axes.set_title(title)
 
-        plt.savefig(os.path.join(self.graph_directory, file_name), bbox_inches='tight')
-        plt.close()
+        self._save_chart(figure, chart_name)
 
-    def _configure_pie_chart(self, title: str, values: list[float], currencies: list[str], file_name: str) -> None:
+    def _chart_key(self, chart_name: str) -> str:
         """
-        Modularize repeatable elements of code for drawing pie charts
+        Make cache key from everything chart depends on - currencies, percentages, dates, chart type and rates
         """
-        plt.figure(figsize=(7, 7))
-        plt.pie(values, labels = currencies, autopct='%1.1f%%', startangle=140) #autopct -> decimal places
-        plt.title(title)
+        content = [self._get_currency_codes(), [str(percent) for percent in self._get_currency_percentage()],
+                   self.start_date, self.end_date, self.rebalance, self.drift_threshold, chart_name, self.rate_frame.version]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()[:32]
 
-        if not os.path.exists(self.graph_directory): #if no graph dir - make one
-            os.makedirs(self.graph_directory)
+    def _is_chart_cached(self, chart_name: str) -> bool:
+        """
+        Check if the same chart was already rendered, then drawing can be skipped
+        """
+        key = self._chart_key(chart_name)
+        if key in self.chart_cache:
+            self.chart_files[chart_name] = key
+            return True
+        return False
 
-        plt.savefig(os.path.join(self.graph_directory, file_name), bbox_inches='tight')
-        plt.close()
+    def _save_chart(self, figure: 'Figure', chart_name: str) -> None:
+        """
+        Render chart to PNG and save it in chart cache
+        """
+        buffer = BytesIO()
+        figure.savefig(buffer, format='png', bbox_inches='tight')
+
+        key = self._chart_key(chart_name)
+        self.chart_cache.put(key, buffer.getvalue())
+        self.chart_files[chart_name] = key
 
     def plot_currency_allocation_over_time(self) -> None:
         """
         Draw line chart for how percentage share of currencies changed over dates
         """
-        dates, _, _, _ = self._get_dates_and_mid() #get only dates
-
-        #placeholders
-        first_percentage_alloc = []
-        second_percentage_alloc = []
-        third_percentage_alloc = []
-
-        #calculate percentage share for each day
-        for first, second, third, total in zip(self.value_for_first, self.value_for_second, self.value_for_third, self.total_value):
-            first_percentage_alloc.append((first / total) * 100)
-            second_percentage_alloc.append((second / total) * 100)
-            third_percentage_alloc.append((third / total) * 100)
+        dates = list(self.rate_frame.dates)
 
-        plt.plot(dates, first_percentage_alloc, marker = '.', linestyle = '-', color = 'r', label = self.first_currency_dict.get('currency'))
-        plt.plot(dates, second_percentage_alloc, marker = '.', linestyle = '-', color = 'g', label = self.second_currency_dict.get('currency'))
-        plt.plot(dates, third_percentage_alloc, marker = '.', linestyle = '-', color = 'b', label = self.third_currency_dict.get('currency'))
+        if not self._is_chart_cached('percentage_allocation_chart'): #the same chart was rendered before - skip matplotlib
+            Figure, _ = load_plotting()
+            figure = Figure()
+            axes = figure.subplots()
+            for index, (code, shares) in enumerate(zip(self.portfolio.codes, self.portfolio.shares.T)):
+                axes.plot(dates, shares, marker = '.', linestyle = '-', color = self._line_color(index), label = code)
 
-        self._configure_graph('Procentowy udział walut w czasie', '%', dates, 'percentage_allocation_chart.png')
+            self._configure_graph(figure, axes, 'Procentowy udział walut w czasie', '%', dates, 'percentage_allocation_chart')
@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+class JobStore:
+    """
+    Persistent SQLite store for analysis jobs shared by all web and worker processes.
+    Any web process can answer status of job submitted by other one, workers save results themselves.
+    """
+    UNFINISHED = ('queued', 'running')
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock() #sqlite allows only one writer at a time
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory): #if no store dir - make one
+            os.makedirs(directory)
+
+        with self._connect() as connection:
+            #times are seconds since epoch, so they can be compared between processes
+            connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                               'job_id TEXT PRIMARY KEY, status TEXT NOT NULL, meta TEXT NOT NULL, result TEXT, error TEXT, '
+                               'created REAL NOT NULL, finished REAL)')
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open new connection for every operation, so store can be used from many threads and processes
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection: #commit on success, rollback on error
+                yield connection
+        finally:
+            connection.close()
+
+    def add(self, job_id: str, meta: dict, max_unfinished: int) -> bool:
+        """
+        Save new queued job, False if there are already max_unfinished queued and running jobs (in all processes)
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE') #count and insert in one write transaction, so two processes cannot both take last place
+            unfinished = connection.execute('SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)', self.UNFINISHED).fetchone()[0]
+            if unfinished >= max_unfinished:
+                return False
+            connection.execute('INSERT INTO jobs (job_id, status, meta, created) VALUES (?, ?, ?, ?)',
+                               (job_id, 'queued', json.dumps(meta), time.time()))
+            return True
+
+    def start(self, job_id: str) -> bool:
+        """
+        Mark queued job as running, False if job is not queued any more (expired or failed meanwhile)
+        """
+        with self._lock, self._connect() as connection:
+            cursor = connection.execute("UPDATE jobs SET status = 'running' WHERE job_id = ? AND status = 'queued'", (job_id,))
+            return cursor.rowcount == 1
+
+    def finish(self, job_id: str, result: dict) -> None:
+        with self._lock, self._connect() as connection:
+            connection.execute("UPDATE jobs SET status = 'done', result = ?, finished = ? WHERE job_id = ?",
+                               (json.dumps(result), time.time(), job_id))
+
+    def fail(self, job_id: str, error: str) -> None:
+        """
+        Mark job as failed, job which is already finished keeps its result
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute("UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE job_id = ? AND status IN (?, ?)",
+                               (error, time.time(), job_id, *self.UNFINISHED))
+
+    def get(self, job_id: str) -> dict | None:
+        """
+        Get job with its status, meta and result or error, None if job is unknown
+        """
+        with self._connect() as connection:
+            row = connection.execute('SELECT status, meta, result, error FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        status, meta, result, error = row
+        job = {'job_id': job_id, 'status': status, 'meta': json.loads(meta)}
+        if status == 'done':
+            job['result'] = json.loads(result)
+        elif status == 'failed':
+            job['error'] = error
+        return job
+
+    def count(self) -> dict[str, int]:
+        """
+        Number of queued and running jobs
+        """
+        with self._connect() as connection:
+            rows = connection.execute('SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status', self.UNFINISHED).fetchall()
+        return {'queued': 0, 'running': 0, **dict(rows)}
+
+    def expire(self, result_ttl: float, job_timeout: float) -> None:
+        """
+        Delete jobs finished more than result_ttl seconds ago and fail jobs unfinished after job_timeout seconds -
+        they were lost with process which ran them
+        """
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            connection.execute('DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?', (now - result_ttl,))
+            connection.execute("UPDATE jobs SET status = 'failed', error = 'Analysis did not finish in time', finished = ? "
+                               'WHERE status IN (?, ?) AND created < ?', (now, *self.UNFINISHED, now - job_timeout))
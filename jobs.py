@@ -0,0 +1,115 @@
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from chart_cache import ChartCache
+from investment import Investment
+from job_store import JobStore
+from nbp_api import NbpApi
+from rate_store import RateStore
+from warmup import preload_plotting
+
+class QueueFullError(Exception):
+    """
+    Raised when there are too many waiting analyses, caller should try again later
+    """
+
+#objects of worker process, created once in every worker by _init_worker
+_worker_nbp_api = None
+_worker_chart_cache = None
+_worker_job_store = None
+
+def _init_worker(rate_store_path: str, chart_directory: str, base_url: str, offline: bool) -> None:
+    """
+    Prepare NbpApi, chart cache and matplotlib in worker process, NbpApi and cache use the same files as web process
+    """
+    global _worker_nbp_api, _worker_chart_cache
+    _worker_nbp_api = NbpApi(RateStore(rate_store_path), offline=offline, base_url=base_url)
+    _worker_chart_cache = ChartCache(chart_directory)
+    preload_plotting() #workers exist to draw charts, so matplotlib is loaded before first job comes
+
+def run_analysis(currency_dict: dict[str, dict[str, str]], start_values: dict[str, str], start_date: str,
+                 horizon_days: int, chart_mode: str, rebalance_options: dict | None = None) -> dict:
+    """
+    Carry out whole analysis in worker process, charts are saved in shared chart cache directory
+    """
+    investment = Investment(currency_dict, start_date, _worker_nbp_api, _worker_chart_cache, horizon_days, **(rebalance_options or {}))
+    return investment.analyze(start_values, chart_mode)
+
+def _run_job(job_store_path: str, job_id: str, func: callable, *args) -> None:
+    """
+    Run job in worker process and save its status and result (or error) in job store
+    """
+    global _worker_job_store
+    if _worker_job_store is None:
+        _worker_job_store = JobStore(job_store_path)
+    if not _worker_job_store.start(job_id): #job expired while it was waiting
+        return
+
+    try:
+        result = func(*args)
+    except Exception as e:
+        _worker_job_store.fail(job_id, str(e))
+    else:
+        _worker_job_store.finish(job_id, result)
+
+class JobQueue:
+    """
+    Run analyses in bounded pool of processes (matplotlib is CPU bound and holds GIL) and keep results for some time.
+    Jobs and results are kept in JobStore, so status can be asked from any web process (gunicorn workers).
+    When too many analyses wait, new ones are rejected instead of making every request slow.
+    """
+    def __init__(self, store: JobStore, max_workers: int, max_pending: int, result_ttl: float, initargs: tuple, job_timeout: float = 900) -> None:
+        self.store = store
+        self.max_workers = max_workers #worker processes of this web process
+        self.max_pending = max_pending #queued and running jobs together, in all web processes
+        self.result_ttl = result_ttl #seconds to keep finished job
+        self.job_timeout = job_timeout #seconds after which unfinished job is taken as lost
+        self._initargs = initargs
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Start pool on first job, not when queue is created - app module is imported in gunicorn master (--preload),
+        and pool created there (its processes, pipes and manager thread) would be shared by all forked web workers
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker, initargs=self._initargs)
+            return self._executor
+
+    def submit(self, func: callable, *args, meta: dict | None = None) -> str:
+        """
+        Put job in queue and return its id at once
+        """
+        self.store.expire(self.result_ttl, self.job_timeout)
+        job_id = uuid.uuid4().hex
+        if not self.store.add(job_id, meta or {}, self.max_pending):
+            raise QueueFullError(f'{self.max_pending} analyses are already waiting')
+
+        future = self._get_executor().submit(_run_job, self.store.path, job_id, func, *args)
+        future.add_done_callback(lambda future: self._check_failed(job_id, future))
+        return job_id
+
+    def _check_failed(self, job_id: str, future: Future) -> None:
+        """
+        Mark job as failed when worker could not save it itself, e.g. worker process was killed
+        """
+        if future.exception() is not None:
+            self.store.fail(job_id, str(future.exception()))
+
+    def get(self, job_id: str) -> dict | None:
+        """
+        Get status of job (queued, running, done, failed) with result or error, None if job is unknown or expired
+        """
+        self.store.expire(self.result_ttl, self.job_timeout)
+        return self.store.get(job_id)
+
+    def depth(self) -> dict[str, int]:
+        """
+        Number of queued and running jobs in all web processes, used for reporting load
+        """
+        return {**self.store.count(), 'max_pending': self.max_pending}
@@ -0,0 +1,184 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+class Trace:
+    """
+    Time spent in every stage during one request
+    """
+    def __init__(self) -> None:
+        self.stages = {}
+        self._lock = threading.Lock() #stages are added also from NbpApi worker threads
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """
+        Format stages as Server-Timing header, browsers show it in network tab
+        """
+        with self._lock:
+            return ', '.join(f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in self.stages.items())
+
+_current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar('current_trace', default=None)
+
+def start_trace() -> Trace:
+    """
+    Start collecting stage times for current request
+    """
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+def end_trace() -> None:
+    """
+    Stop collecting stage times, so the next request served by the same thread does not add to old trace
+    """
+    _current_trace.set(None)
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+class CallCounter:
+    """
+    Number of HTTP requests to NBP made by one analysis
+    """
+    def __init__(self) -> None:
+        self.count = 0
+        self._lock = threading.Lock() #requests are made also from NbpApi worker threads
+
+    def add(self) -> None:
+        with self._lock:
+            self.count += 1
+
+_upstream_counter: contextvars.ContextVar[CallCounter | None] = contextvars.ContextVar('upstream_counter', default=None)
+
+@contextmanager
+def count_upstream_calls():
+    """
+    Count HTTP requests to NBP made inside block, also by NbpApi worker threads (they run in copy of caller context).
+    Requests of download started by other caller and joined by this one are counted there, not here.
+    """
+    counter = CallCounter()
+    token = _upstream_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _upstream_counter.reset(token)
+
+def record_upstream_call() -> None:
+    counter = _upstream_counter.get()
+    if counter is not None:
+        counter.add()
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+class Counter:
+    """
+    Value which only grows, e.g. number of requests
+    """
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            lines += [f'{self.name}{_format_labels(key)} {value}' for key, value in sorted(self._values.items())]
+        return lines
+
+class Histogram:
+    """
+    Distribution of durations in buckets, e.g. how long NBP API answers
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._values = {} #labels -> [count in each bucket, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            bucket_counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[index] += 1
+            self._values[key] = (bucket_counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", str(bound)),))} {bucket_count}')
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {count}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+class Gauge:
+    """
+    Value read at the moment of scraping, e.g. cache statistics kept by other objects
+    """
+    def __init__(self, name: str, help_text: str, read_func: callable) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.read_func = read_func #returns {labels tuple: value}
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        lines += [f'{self.name}{_format_labels(key)} {value}' for key, value in sorted(self.read_func().items())]
+        return lines
+
+class MetricsRegistry:
+    """
+    All metrics of application, rendered in Prometheus text format
+    """
+    def __init__(self) -> None:
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram('analysis_stage_seconds', 'Time spent in analysis stages (fetch, gap_fill, compute, render)'))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram('nbp_upstream_request_seconds', 'Duration of single NBP API request'))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter('nbp_upstream_requests_total', 'NBP API requests by result'))
+HTTP_SECONDS = REGISTRY.register(Histogram('http_request_seconds', 'Duration of handled HTTP requests'))
+HTTP_REQUESTS = REGISTRY.register(Counter('http_requests_total', 'Handled HTTP requests by endpoint and status'))
+
+@contextmanager
+def timed(stage: str):
+    """
+    Measure block of code as analysis stage, in metrics and in trace of current request
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        trace = current_trace()
+        if trace is not None:
+            trace.add(stage, seconds)
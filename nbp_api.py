@@ -1,24 +1,101 @@
 import requests
+import contextvars
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from requests.adapters import HTTPAdapter
+
+import metrics
+from rate_store import RateStore
+from rate_table import RateTable
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+class NbpApiError(Exception):
+    """
+    Rates could not be downloaded from NBP API, so analysis cannot be made
+    """
+
 class NbpApi:
     """
     Class for getting values from NBP API
     """
-    def __init__(self) -> None:
-        self.base_url = 'https://api.nbp.pl/api/exchangerates/'
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    MAX_RANGE_DAYS = 93 #NBP API rejects longer ranges in one request
+    TABLE_A_PUBLISHED_UTC = (11, 30) #table A is published on working days between 11:45 and 12:15 Warsaw time, this hour is after it all year
+    CURRENCY_LIST_RETRY = timedelta(minutes=5) #how long to wait after failed refresh of currency list
+    CURRENCY_LIST_TIMEOUT = 10 #seconds, index page waits for the list, so it is downloaded once without retries
+
+    def __init__(self, rate_store: RateStore | None = None, offline: bool = False, base_url: str = 'https://api.nbp.pl/api/exchangerates/',
+                 max_workers: int = 4, timeout: float = 120, retries: int = 2, backoff: float = 0.5) -> None:
+        self.base_url = base_url
+        self.timeout = timeout #seconds for single request
+        self.retries = retries #how many times failed request is repeated
+        self.backoff = backoff #first pause between retries in seconds, doubled after every retry
+        self.rate_store = rate_store #if set, rates are read from local store and only missing ranges are downloaded
+        self.offline = offline #use only rates from local store, never call API for them
+        self.request_count = 0 #HTTP requests to NBP API made by this object in all threads (retries included), per analysis see metrics.count_upstream_calls
+        self.cache_stats = {'hits': 0, 'misses': 0, 'gap_fetches': 0}
+        self._count_lock = threading.Lock()
+
+        #one keep-alive session shared by all workers, pool as big as number of parallel requests
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        self._http_slots = threading.BoundedSemaphore(max_workers) #bounds number of parallel requests to NBP
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nbp-api') #downloads whole currencies
+        self._chunk_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nbp-api-chunk') #downloads parts of long ranges, separate pool so currency workers never wait for themselves
+        self._in_flight: dict[tuple[str, str, str], Future] = {} #requests being downloaded right now, shared by all callers
+        self._in_flight_lock = threading.Lock()
+
+        #currency list changes at most once a day, so it is kept in memory until next table A publication
+        self._currency_list = []
+        self._currency_list_expires = None
+        self._currency_list_refreshing = False
+        self._currency_list_lock = threading.Lock()
+
+    def _get_json(self, url: str, timeout: float | None = None, retries: int | None = None) -> dict | list | None:
+        """
+        Make API request and return parsed JSON, None if NBP has no data for given range (404).
+        Timeout and number of retries of this object are used if not given.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            with self._count_lock:
+                self.request_count += 1
+            metrics.record_upstream_call()
+
+            started = time.perf_counter()
+            try:
+                with self._http_slots:
+                    response = self.session.get(url, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.UPSTREAM_REQUESTS.inc(result='error')
+                if attempt == retries:
+                    raise
+            else:
+                metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - started)
+                metrics.UPSTREAM_REQUESTS.inc(result=str(response.status_code))
+                if response.status_code == 404: #NBP answers 404 when there are no rates in range (weekends, holidays)
+                    return None
+                if response.status_code not in self.RETRY_STATUSES or attempt == retries:
+                    response.raise_for_status()
+                    return response.json()
 
-    def _make_request(self, url: str, clean_func: callable) -> list[dict]:
+            logging.warning(f'Request to {url} failed, retry {attempt + 1} of {retries}')
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def _make_request(self, url: str, clean_func: callable, timeout: float | None = None, retries: int | None = None) -> list[dict]:
         """
         Make API request and clean the response
         """
         try:
-            response = requests.get(url, timeout=120)
-            response.raise_for_status()
-            return clean_func(response.json())
+            return clean_func(self._get_json(url, timeout, retries))
         except requests.exceptions.RequestException as e:
             logging.error(f'Error while connecting to API: {e}')
             return []
@@ -49,100 +126,216 @@ class NbpApi:
             logging.error(f'End date {end_date} is in the future')
             raise ValueError(f'End date {end_date} is in the future')
         
-    def adjust_start_date(self, start_date: str) -> str:
+    def get_currency_list(self) -> list[dict]:
         """
-        Adjust start date if it falls on a weekend
+        Get list of currencies and their codes.
+        Cached list is returned at once, when it is out of date it is refreshed in background and old list is returned meanwhile.
         """
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+        with self._currency_list_lock:
+            if not self._currency_list: #nothing cached yet - caller has to wait
+                refresh_now = True
+            else:
+                refresh_now = False
+                if datetime.now(timezone.utc) >= self._currency_list_expires and not self._currency_list_refreshing:
+                    self._currency_list_refreshing = True
+                    self._executor.submit(self.refresh_currency_list)
+                return self._currency_list
 
-        if start_date_obj.weekday() == 5:  # 5 -> Saturday
-            start_date_obj -= timedelta(days=1)  # Take Friday date
-        elif start_date_obj.weekday() == 6:  # If Sunday -> take Friday date
-            start_date_obj -= timedelta(days=2)
+        if refresh_now: #concurrent callers wait for the same download
+            self._submit_in_flight(('currency_list', '', ''), self.refresh_currency_list).result()
+        return self._currency_list
 
-        return start_date_obj.strftime('%Y-%m-%d')
+    def refresh_currency_list(self) -> list[dict]:
+        """
+        Download currency list from the latest table A, when API fails the last good list is kept.
+        In offline mode, or when API fails and no list was downloaded yet, list is made from the latest table in local store.
+        """
+        currency_list = []
+        from_api = False
+        try:
+            rows = []
+            if not self.offline:
+                full_url = f'{self.base_url}tables/A/?format=json'
+                rows = self._make_request(full_url, self.clean_tables, self.CURRENCY_LIST_TIMEOUT, retries=0)  # Get the latest table from API (errors are logged there)
+                from_api = bool(rows)
 
-    def get_currency_list(self) -> list[dict]:
+            if from_api and self.rate_store is not None: #rates of the latest table are stored too, so they are not downloaded again
+                self.rate_store.save_table_rates('A', rows, rows[0]['effectiveDate'], rows[0]['effectiveDate'])
+            elif self.rate_store is not None and (self.offline or not self._currency_list):
+                rows = self.rate_store.latest_table_rates('A')
+
+            if rows:
+                effective_date = rows[0]['effectiveDate']
+                currency_list = RateTable.from_rows(rows, effective_date, effective_date).currency_list()
+        finally:
+            now = datetime.now(timezone.utc)
+            with self._currency_list_lock:
+                self._currency_list_refreshing = False #also on error, otherwise list would never be refreshed again
+                if currency_list:
+                    self._currency_list = currency_list
+                    #list from store after failed download is replaced as soon as API answers again
+                    self._currency_list_expires = self._next_publication(now) if from_api or self.offline else now + self.CURRENCY_LIST_RETRY
+                elif self._currency_list:
+                    logging.warning('Could not refresh currency list, using last downloaded list')
+                    self._currency_list_expires = now + self.CURRENCY_LIST_RETRY
+
+        return self._currency_list
+
+    def warm_currency_list(self, background: bool = False) -> None:
         """
-        Get list of currencies and their codes
+        Download currency list before first page view, e.g. on application start
         """
-        full_url = f'{self.base_url}tables/A/?format=json'  
-        return self._make_request(full_url, self.clean_currency_list)  # Get currencies and their codes from API
-        
-    def get_currency_rates(self, curr_code: str, start_date: str, end_date: str) -> list[dict]:
+        if background:
+            self._executor.submit(self.refresh_currency_list)
+        else:
+            self.refresh_currency_list()
+
+    def _next_publication(self, now: datetime) -> datetime:
         """
-        Get list of certain currency rates from start_date to end_date
+        Get time (UTC) of the next table A publication after now, tables are published only on working days
         """
-        self._validate_dates(start_date, end_date)  # Validate dates
-        valid_start_date = self.adjust_start_date(start_date)  # Check if start_date is not on the weekend
+        hour, minute = self.TABLE_A_PUBLISHED_UTC
+        publication = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if publication <= now:
+            publication += timedelta(days=1)
+        while publication.weekday() >= 5:
+            publication += timedelta(days=1)
+        return publication
         
-        full_url = f'{self.base_url}rates/A/{curr_code}/{valid_start_date}/{end_date}/?format=json'
-        api_response = self._make_request(full_url, self.clean_currency_rates)  # Get rates for specific currency
-        refactored_response = self.fill_missing_dates(api_response, start_date, end_date)  # Fill missing dates
-        return refactored_response
+    def split_range(self, start_date: str, end_date: str) -> list[tuple[str, str]]:
+        """
+        Split date range into ranges which NBP API accepts in one request
+        """
+        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+
+        chunks = []
+        while start_date_obj <= end_date_obj:
+            chunk_end = min(start_date_obj + timedelta(days=self.MAX_RANGE_DAYS - 1), end_date_obj)
+            chunks.append((start_date_obj.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d')))
+            start_date_obj = chunk_end + timedelta(days=1)
+        return chunks
 
-    def clean_currency_list(self, api_response: dict) -> list[dict]:
+    def _map_chunks(self, func: callable, chunks: list[tuple[str, str]]) -> list:
         """
-        Clean API response to get only currency name and its code
+        Run func for every chunk in chunk pool, each task gets its own copy of caller context (request trace)
         """
-        if api_response:
-            rates = api_response[0].get('rates', [])
-            return [{'currency': rate['currency'], 'code': rate['code']} for rate in rates]  # New dict with only needed keys and codes
-        return []
-    
-    def clean_currency_rates(self, api_response: dict) -> list[dict]:
+        contexts = [contextvars.copy_context() for _ in chunks]
+        return list(self._chunk_executor.map(lambda context, chunk: context.run(func, chunk), contexts, chunks))
+
+    def _submit_in_flight(self, key: tuple[str, str, str], func: callable, *args) -> Future:
         """
-        Delete unnecessary "no" key
+        Run func in worker thread, or join the same work (same key) which is already running
         """
-        if api_response:
-            rates = api_response.get('rates', [])
-            for rate in rates:
-                if "no" in rate:
-                    del rate["no"] 
-            return rates
-        return []
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            is_new = future is None
+            if is_new:
+                #copy of context keeps request trace in worker thread
+                future = self._executor.submit(contextvars.copy_context().run, func, *args)
+                self._in_flight[key] = future
+
+        if is_new: #outside of lock - callback runs at once if download is already finished
+            future.add_done_callback(lambda _: self._forget_in_flight(key))
 
-    def fill_missing_dates(self, data: list[dict], start_date: str, end_date: str) -> list[dict]:
+        return future
+
+    def _forget_in_flight(self, key: tuple[str, str, str]) -> None:
         """
-        NBP API does not provide data on weekends and holidays.
-        Rates on missing days will be replaced with previous day rates or Friday rates if the missing day is weekend.
+        Remove finished download, so next request gets fresh data (or data from store)
+        """
+        with self._in_flight_lock:
+            self._in_flight.pop(key, None)
+
+    def get_rate_table(self, start_date: str, end_date: str) -> RateTable:
+        """
+        Get rates of every table A currency from start_date to end_date as one (days x codes) table.
+        Whole tables are downloaded, so any number of currencies costs one request per 93 days.
+        """
+        self._validate_dates(start_date, end_date)  # Validate dates here, so error is raised in caller thread
+        return self._submit_in_flight((RateStore.ALL_CODES, start_date, end_date), self._load_rate_table, start_date, end_date).result()
+
+    def _load_rate_table(self, start_date: str, end_date: str) -> RateTable:
+        #days before start_date are loaded too, so rate published before weekend or holiday at the start is known
+        fill_start_date = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=RateTable.MAX_FILL_DAYS)).strftime('%Y-%m-%d')
+
+        missing_ranges = []
+        if self.rate_store is None:
+            rows = self._download_tables(fill_start_date, end_date)
+        else:
+            rows, missing_ranges = self._get_stored_tables(fill_start_date, end_date)  # Get tables from local store, download only missing ranges
+
+        with metrics.timed('gap_fill'):
+            return RateTable.from_rows(rows, start_date, end_date, missing_ranges)  # Fill missing dates for all currencies at once
+
+    def _download_tables(self, start_date: str, end_date: str) -> list[dict]:
+        """
+        Download whole tables straight from API, long ranges are downloaded in parallel parts and joined
+        """
+        def download_chunk(chunk: tuple[str, str]) -> list[dict]:
+            return self._download_table_range(*chunk)
+
+        chunks = self.split_range(start_date, end_date)
+        if len(chunks) == 1:
+            return download_chunk(chunks[0])
+        return [row for rows in self._map_chunks(download_chunk, chunks) for row in rows]
+
+    def _get_stored_tables(self, start_date: str, end_date: str) -> tuple[list[dict], list[tuple[str, str]]]:
+        """
+        Get tables from local store and download only date ranges which are not stored yet.
+        Returns rows and date ranges which are still missing (in offline mode nothing is downloaded).
+        """
+        gaps = self.rate_store.missing_ranges('A', RateStore.ALL_CODES, start_date, end_date)
+
+        with self._count_lock:
+            self.cache_stats['misses' if gaps else 'hits'] += 1
+
+        missing_ranges = []
+        if gaps and self.offline:
+            logging.warning(f'Offline mode - no stored tables in {gaps}')
+            missing_ranges = gaps
+        elif gaps:
+            chunks = [chunk for gap_start, gap_end in gaps for chunk in self.split_range(gap_start, gap_end)]
+            list(self._map_chunks(lambda chunk: self._fetch_gap(*chunk), chunks))
+
+        return self.rate_store.load_table_rates('A', start_date, end_date), missing_ranges
+
+    def _fetch_gap(self, start_date: str, end_date: str) -> None:
+        """
+        Download whole tables for one missing range and save them in local store
         """
-        data_dict = {entry['effectiveDate']: entry['mid'] for entry in data}
-        
-        complete_data = []
-        
         start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
         end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        
-        last_mid  = None  # Empty placeholder
-
-        current_date = start_date_obj
-        while current_date <= end_date_obj:
-            date_str = current_date.strftime('%Y-%m-%d')
-            
-            if date_str in data_dict:
-                last_mid = data_dict[date_str]
-                complete_data.append({'effectiveDate': date_str, 'mid': last_mid})
-            else:
-                if current_date.weekday() < 5: 
-                    if last_mid is not None:
-                        complete_data.append({'effectiveDate': date_str, 'mid': last_mid})
-                else:
-                    backtrack_date = current_date
-                    while backtrack_date.weekday() >= 5:
-                        backtrack_date -= timedelta(days=1)
-                    
-                    backtrack_date_str = backtrack_date.strftime('%Y-%m-%d')
-                    if backtrack_date_str in data_dict:
-                        last_mid = data_dict[backtrack_date_str]
-                        complete_data.append({'effectiveDate': date_str, 'mid': last_mid})
-
-            current_date += timedelta(days=1)  # To start next day
-
-        complete_data = [
-            # Leaves only dates from between start_date and end_date
-            entry for entry in complete_data 
-                if start_date_obj <= datetime.strptime(entry['effectiveDate'], '%Y-%m-%d').date() <= end_date_obj
-        ]
-
-        return complete_data
+        if (end_date_obj - start_date_obj).days < 2 and all(day.weekday() >= 5 for day in (start_date_obj, end_date_obj)):
+            self.rate_store.save_table_rates('A', [], start_date, end_date)  # Only weekend is missing - nothing to download
+            return
+
+        rates = self._download_table_range(start_date, end_date)  # On error range is not marked as downloaded, next request will try again
+
+        with self._count_lock:
+            self.cache_stats['gap_fetches'] += 1
+        self.rate_store.save_table_rates('A', rates, start_date, end_date)
+
+    def _download_table_range(self, start_date: str, end_date: str) -> list[dict]:
+        """
+        Download whole tables for range accepted by API in one request, raise NbpApiError if it fails -
+        missing part of range must not be filled with rates from before it
+        """
+        full_url = f'{self.base_url}tables/A/{start_date}/{end_date}/?format=json'
+        try:
+            return self.clean_tables(self._get_json(full_url))
+        except requests.exceptions.RequestException as e:
+            logging.error(f'Error while connecting to API: {e}')
+            raise NbpApiError(f'Could not download rates from {start_date} to {end_date}') from e
+        except ValueError as json_error:
+            logging.error(f'Error while parsing JSON: {json_error}')
+            raise NbpApiError(f'Could not download rates from {start_date} to {end_date}') from json_error
+
+    def clean_tables(self, api_response: list) -> list[dict]:
+        """
+        Flatten tables to one row for every day and currency: effective date, code, currency name and mid
+        """
+        if api_response:
+            return [{'effectiveDate': table['effectiveDate'], 'code': rate['code'], 'currency': rate['currency'], 'mid': rate['mid']}
+                    for table in api_response for rate in table.get('rates', [])]
+        return []
@@ -0,0 +1,141 @@
+from datetime import datetime
+from functools import cached_property
+
+import numpy as np
+
+class Portfolio:
+    """
+    Portfolio computed on (days x currencies) rate matrix, buy-and-hold or rebalanced back to target weights.
+    All values are calculated with array operations, so number of days and currencies does not matter.
+    """
+    REBALANCE_PERIODS = ('daily', 'weekly', 'monthly')
+
+    def __init__(self, dates: list[datetime], codes: list[str], rates: np.ndarray, weights: list[float], start_money: float = 1000,
+                 rebalance: str | None = None, drift_threshold: float | None = None) -> None:
+        self.dates = dates
+        self.codes = codes
+        self.rates = np.asarray(rates, dtype=float) #rows -> days, columns -> currencies
+        self.weights = np.asarray(weights, dtype=float) #share of start money for each currency, 0.3 -> 30%
+        self.start_money = start_money
+        self.rebalance = rebalance #'daily', 'weekly' or 'monthly' - rebalance on first day of every period
+        self.drift_threshold = drift_threshold #rebalance when share of any currency moves this many percentage points from target
+
+        if self.rates.ndim != 2 or self.rates.shape[1] != len(self.weights):
+            raise ValueError(f'Rates shape {self.rates.shape} does not match {len(self.weights)} weights')
+        if rebalance is not None and rebalance not in self.REBALANCE_PERIODS:
+            raise ValueError(f'Unknown rebalance period {rebalance}')
+        if drift_threshold is not None and drift_threshold <= 0:
+            raise ValueError('Drift threshold must be positive')
+
+    @staticmethod
+    def totals_for_weights(rates: np.ndarray, weights: np.ndarray, start_money: float = 1000) -> np.ndarray:
+        """
+        Portfolio value for each day and each row of weights at once, result rows -> days, columns -> weights rows
+        """
+        units = start_money * np.asarray(weights, dtype=float) / rates[0] #rows -> weights rows, columns -> currencies
+        return rates @ units.T
+
+    @cached_property
+    def units(self) -> np.ndarray:
+        """
+        How much of each currency was bought on first day
+        """
+        return self.start_money * self.weights / self.rates[0]
+
+    @cached_property
+    def rebalance_days(self) -> np.ndarray:
+        """
+        Indexes of days on which portfolio is bought again with target weights, first day included
+        """
+        if self.drift_threshold is not None:
+            return self._drift_result[1]
+
+        if self.rebalance is None:
+            return np.zeros(1, dtype=int)
+
+        if self.rebalance == 'daily':
+            return np.arange(len(self.rates))
+
+        days = np.array([date.strftime('%Y-%m-%d') for date in self.dates], dtype='datetime64[D]')
+        if self.rebalance == 'weekly':
+            periods = (days.astype(int) + 3) // 7 #1970-01-01 was Thursday, +3 makes weeks start on Monday
+        else:
+            periods = days.astype('datetime64[M]').astype(int)
+        return np.flatnonzero(np.diff(periods, prepend=periods[0] - 1)) #first day of every period
+
+    @cached_property
+    def values(self) -> np.ndarray:
+        """
+        Value in PLN of each currency for each day
+        """
+        if self.drift_threshold is not None:
+            return self._drift_result[0]
+        if self.rebalance is None:
+            return self.rates * self.units
+        return self._segment_values(self.rebalance_days)
+
+    def _segment_values(self, starts: np.ndarray) -> np.ndarray:
+        """
+        Values when portfolio is rebalanced on given days (first day included).
+        Between rebalances every currency grows by its rate change since the last rebalance,
+        so whole schedule is computed at once without going day by day.
+        """
+        days = np.arange(len(self.rates))
+        segment = np.searchsorted(starts, days, side='right') - 1 #which rebalance period each day belongs to
+        growth = self.rates / self.rates[starts[segment]] #rate change since last rebalance
+
+        #portfolio value grows in every period by weighted rate change, value at each rebalance is product of these changes
+        end_growth = (self.rates[starts[1:]] / self.rates[starts[:-1]]) @ self.weights
+        start_values = self.start_money * np.concatenate(([1.0], np.cumprod(end_growth)))
+
+        return start_values[segment][:, np.newaxis] * self.weights * growth
+
+    @cached_property
+    def _drift_result(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Values and rebalance days when portfolio is rebalanced after drifting from target weights.
+        Next rebalance day depends on previous one, so loop goes from rebalance to rebalance (not day by day).
+        """
+        values = np.empty_like(self.rates)
+        starts = []
+        start, start_value = 0, float(self.start_money)
+        while start < len(self.rates):
+            starts.append(start)
+            period_values = start_value * self.weights * (self.rates[start:] / self.rates[start])
+            shares = period_values / period_values.sum(axis=1)[:, np.newaxis]
+            drifted = np.flatnonzero(np.abs(shares[1:] - self.weights).max(axis=1) * 100 > self.drift_threshold) + 1 #first day of period is on target
+
+            end = start + int(drifted[0]) if drifted.size else len(self.rates)
+            values[start:end] = period_values[:end - start]
+            if end < len(self.rates):
+                start_value = float(period_values[end - start].sum()) #rebalance does not change total value
+            start = end
+
+        return values, np.array(starts)
+
+    @cached_property
+    def totals(self) -> np.ndarray:
+        """
+        Value in PLN of whole portfolio for each day
+        """
+        return self.values.sum(axis=1)
+
+    @cached_property
+    def shares(self) -> np.ndarray:
+        """
+        Percentage share of each currency in portfolio for each day
+        """
+        return self.values / self.totals[:, np.newaxis] * 100
+
+    @cached_property
+    def best_index(self) -> int:
+        """
+        Index of day with the highest portfolio value, first one if there are more
+        """
+        return int(np.argmax(self.totals))
+
+    def best_exit(self) -> tuple[float, datetime]:
+        """
+        Get the highest portfolio value and its date
+        """
+        return float(self.totals[self.best_index]), self.dates[self.best_index]
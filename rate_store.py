@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+class RateStore:
+    """
+    Persistent SQLite store for NBP rates.
+    Published fixings never change, so once a date range is downloaded it is kept on disk and never asked for again.
+    """
+    ALL_CODES = '*' #coverage code meaning that whole table (every currency) was downloaded for the range
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock() #sqlite allows only one writer at a time
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory): #if no store dir - make one
+            os.makedirs(directory)
+
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS rates ('
+                               'table_name TEXT NOT NULL, code TEXT NOT NULL, effective_date TEXT NOT NULL, mid REAL NOT NULL, '
+                               'PRIMARY KEY (table_name, code, effective_date))')
+            #date ranges that were already downloaded - needed because weekends and holidays have no rows in rates table
+            connection.execute('CREATE TABLE IF NOT EXISTS coverage ('
+                               'table_name TEXT NOT NULL, code TEXT NOT NULL, start_date TEXT NOT NULL, end_date TEXT NOT NULL)')
+            #currency names, so currency list can be made from stored table when API cannot be used
+            connection.execute('CREATE TABLE IF NOT EXISTS currencies ('
+                               'table_name TEXT NOT NULL, code TEXT NOT NULL, currency TEXT NOT NULL, PRIMARY KEY (table_name, code))')
+
+    @contextmanager
+    def _connect(self):
+        """
+        Open new connection for every operation, so store can be used from many threads
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection: #commit on success, rollback on error
+                yield connection
+        finally:
+            connection.close()
+
+    def _get_coverage(self, connection: sqlite3.Connection, table: str, code: str) -> list[tuple[date, date]]:
+        """
+        Get sorted list of downloaded date ranges for currency
+        """
+        rows = connection.execute('SELECT start_date, end_date FROM coverage WHERE table_name = ? AND code = ? ORDER BY start_date',
+                                  (table, code)).fetchall()
+        return [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in rows]
+
+    def missing_ranges(self, table: str, code: str, start_date: str, end_date: str) -> list[tuple[str, str]]:
+        """
+        Get date ranges between start_date and end_date which were never downloaded
+        """
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+
+        with self._connect() as connection:
+            coverage = self._get_coverage(connection, table, code)
+
+        gaps = []
+        current = start
+        for covered_start, covered_end in coverage:
+            if covered_end < current:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > current: #there is hole before this covered range
+                gaps.append((current, covered_start - timedelta(days=1)))
+            current = max(current, covered_end + timedelta(days=1))
+            if current > end:
+                break
+
+        if current <= end:
+            gaps.append((current, end))
+
+        return [(gap_start.isoformat(), gap_end.isoformat()) for gap_start, gap_end in gaps]
+
+    def save_table_rates(self, table: str, rates: list[dict], start_date: str, end_date: str) -> None:
+        """
+        Save rates of whole tables ({'effectiveDate', 'code', 'mid'} and optional 'currency' for every currency) and mark range as downloaded
+        """
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+        currencies = {rate['code']: rate['currency'] for rate in rates if rate.get('currency')}
+
+        with self._lock, self._connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO rates (table_name, code, effective_date, mid) VALUES (?, ?, ?, ?)',
+                                   [(table, rate['code'], rate['effectiveDate'], rate['mid']) for rate in rates])
+            connection.executemany('INSERT OR REPLACE INTO currencies (table_name, code, currency) VALUES (?, ?, ?)',
+                                   [(table, code, currency) for code, currency in currencies.items()])
+            self._merge_coverage(connection, table, self.ALL_CODES, start, end)
+
+    def _merge_coverage(self, connection: sqlite3.Connection, table: str, code: str, start: date, end: date) -> None:
+        """
+        Merge new range with overlapping or neighbouring ranges, so coverage table stays small
+        """
+        merged = []
+        for covered_start, covered_end in sorted(self._get_coverage(connection, table, code) + [(start, end)]):
+            if merged and covered_start <= merged[-1][1] + timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], covered_end))
+            else:
+                merged.append((covered_start, covered_end))
+
+        connection.execute('DELETE FROM coverage WHERE table_name = ? AND code = ?', (table, code))
+        connection.executemany('INSERT INTO coverage (table_name, code, start_date, end_date) VALUES (?, ?, ?, ?)',
+                               [(table, code, covered_start.isoformat(), covered_end.isoformat()) for covered_start, covered_end in merged])
+
+    def load_table_rates(self, table: str, start_date: str, end_date: str) -> list[dict]:
+        """
+        Get stored rates of every currency from start_date to end_date as rows {'effectiveDate', 'code', 'mid'}
+        """
+        with self._connect() as connection:
+            rows = connection.execute('SELECT effective_date, code, mid FROM rates '
+                                      'WHERE table_name = ? AND effective_date BETWEEN ? AND ? ORDER BY effective_date',
+                                      (table, start_date, end_date)).fetchall()
+
+        return [{'effectiveDate': effective_date, 'code': code, 'mid': mid} for effective_date, code, mid in rows]
+
+    def latest_table_rates(self, table: str) -> list[dict]:
+        """
+        Get stored rates of the latest table as rows {'effectiveDate', 'code', 'mid', 'currency'}, empty list if nothing is stored.
+        Currency is None when its name was never stored.
+        """
+        with self._connect() as connection:
+            rows = connection.execute('SELECT rates.effective_date, rates.code, rates.mid, currencies.currency FROM rates '
+                                      'LEFT JOIN currencies ON currencies.table_name = rates.table_name AND currencies.code = rates.code '
+                                      'WHERE rates.table_name = ? AND rates.effective_date = (SELECT MAX(effective_date) FROM rates WHERE table_name = ?) '
+                                      'ORDER BY rates.rowid', (table, table)).fetchall()
+
+        return [{'effectiveDate': effective_date, 'code': code, 'mid': mid, 'currency': currency} for effective_date, code, mid, currency in rows]
@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+import numpy as np
+
+@dataclass(frozen=True, eq=False)
+class RateTable:
+    """
+    Mid rates of every table A currency for every day of date range - rows -> days, columns -> currency codes.
+    Days without publication (weekends, holidays) have the last published rate from at most MAX_FILL_DAYS before,
+    days without such rate (before first publication, after last one, holes in data) are NaN.
+    """
+    MAX_FILL_DAYS = 5 #the longest break in NBP publications - Christmas holidays with weekend, e.g. 24-28.12.2025
+    days: np.ndarray #datetime64[D], every day from start date to end date
+    codes: tuple[str, ...]
+    mids: np.ndarray #(days x codes)
+    currencies: Mapping[str, str] #code -> currency name, empty when rates come from local store
+
+    @classmethod
+    def from_rows(cls, rows: list[dict], start_date: str, end_date: str, missing_ranges: list[tuple[str, str]] = ()) -> 'RateTable':
+        """
+        Build table from rows {'effectiveDate', 'code', 'mid'} (and optional 'currency') in one pass, rows may be in any order.
+        Rows published up to MAX_FILL_DAYS before start_date are used only to fill first days of range.
+        Days in missing_ranges (never loaded) are NaN, they are not filled from earlier rates.
+        """
+        days = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+        codes = tuple(dict.fromkeys(row['code'] for row in rows)) #order of first appearance, like in NBP table
+        currencies = MappingProxyType({row['code']: row['currency'] for row in rows if row.get('currency')})
+        if not rows:
+            return cls(days, codes, np.empty((len(days), 0)), currencies)
+
+        code_index = {code: index for index, code in enumerate(codes)}
+        published = np.array([row['effectiveDate'] for row in rows], dtype='datetime64[D]')
+        published_days, day_rows = np.unique(published, return_inverse=True)
+        table = np.full((len(published_days), len(codes)), np.nan) #rows -> publication days
+        table[day_rows, [code_index[row['code']] for row in rows]] = [row['mid'] for row in rows]
+
+        #for every publication and currency - row of its last known rate (currency can be missing in some tables)
+        known_rows = np.where(np.isnan(table), -1, np.arange(len(published_days))[:, np.newaxis])
+        known_rows = np.maximum.accumulate(known_rows, axis=0)
+
+        last_published = np.searchsorted(published_days, days, side='right') - 1 #last publication on or before each day
+        source_rows = np.where(last_published[:, np.newaxis] >= 0, known_rows[np.maximum(last_published, 0)], -1)
+        known = source_rows >= 0
+        source_rows = np.maximum(source_rows, 0)
+        fresh = known & (days[:, np.newaxis] - published_days[source_rows] <= np.timedelta64(cls.MAX_FILL_DAYS, 'D')) #not older than fill limit
+        mids = np.where(fresh, table[source_rows, np.arange(len(codes))], np.nan)
+        for missing_start, missing_end in missing_ranges:
+            mids[(days >= np.datetime64(missing_start, 'D')) & (days <= np.datetime64(missing_end, 'D'))] = np.nan
+        return cls(days, codes, mids, currencies)
+
+    def column(self, code: str) -> np.ndarray:
+        """
+        Get mid value of one currency for each day, NaN for every day if currency is not in table
+        """
+        if code not in self.codes:
+            return np.full(len(self.days), np.nan)
+        return self.mids[:, self.codes.index(code)]
+
+    def matrix(self, codes: list[str]) -> np.ndarray:
+        """
+        Get (days x currencies) array of mid values, columns in order of codes
+        """
+        return np.column_stack([self.column(code) for code in codes]) if codes else np.empty((len(self.days), 0))
+
+    def currency_list(self) -> list[dict]:
+        """
+        Get currencies of table in the same format as NbpApi currency list
+        """
+        return [{'currency': self.currencies.get(code, code), 'code': code} for code in self.codes]
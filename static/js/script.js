@@ -22,23 +22,36 @@ document.addEventListener('DOMContentLoaded', function() {
     let collapsibleInstances = M.Collapsible.init(collapibleElems);
 });
 
-function validateForm() {
-    let firstAmount = parseInt(document.querySelector('input[name="percentage_first"]').value) || 0;
-    let secondAmount = parseInt(document.querySelector('input[name="percentage_second"]').value) || 0;
-    let thirdAmount = parseInt(document.querySelector('input[name="percentage_third"]').value) || 0;
+function addCurrencyRow() {
+    //new currency row is copied from template, its select must be initialized by materialize
+    let template = document.getElementById('currency-row-template');
+    let row = template.content.firstElementChild.cloneNode(true);
+    document.getElementById('currency-rows').appendChild(row);
+    M.FormSelect.init(row.querySelectorAll('select'));
+}
 
-    let firstCurrency = document.querySelector('select[name="curr_first"]').value;
-    let secondCurrency = document.querySelector('select[name="curr_second"]').value;
-    let thirdCurrency = document.querySelector('select[name="curr_third"]').value;
+function removeCurrencyRow(button) {
+    let rows = document.querySelectorAll('#currency-rows .currency-row');
+    if (rows.length <= 1) {
+        alert('Inwestycja musi mieć przynajmniej jedną walutę!');
+        return;
+    }
+    button.closest('.currency-row').remove();
+}
+
+function validateForm() {
+    let amounts = Array.from(document.querySelectorAll('#currency-rows input[name="percentage"]')).map(input => parseInt(input.value) || 0);
+    let currencies = Array.from(document.querySelectorAll('#currency-rows select[name="currency"]')).map(select => select.value);
 
     let startDate = document.querySelector('input[name="start_date"]').value;
+    let horizonDays = parseInt(document.querySelector('input[name="horizon_days"]').value) || 0;
 
-    if (firstCurrency === "" || secondCurrency === "" || thirdCurrency === "") {
+    if (currencies.includes("")) {
         alert('Proszę wybrać walutę');
         return false;
     }
 
-    if (firstCurrency === secondCurrency || firstCurrency === thirdCurrency || secondCurrency === thirdCurrency) {
+    if (new Set(currencies).size !== currencies.length) {
         alert('Proszę wybrać różne waluty dla każdej pozycji!');
         return false;
     }
@@ -47,13 +60,77 @@ function validateForm() {
         alert('Proszę podać datę rozpoczęcia inwestycji!');
         return false;
     }
+
+    if (horizonDays < 1) {
+        alert('Proszę podać czas trwania inwestycji!');
+        return false;
+    }
+
+    let endDate = new Date(startDate);
+    endDate.setDate(endDate.getDate() + horizonDays - 1);
+    let today = new Date();
+    today.setHours(0, 0, 0, 0);
+
+    if (endDate >= today) {
+        alert('Inwestycja musi zakończyć się przed dzisiejszym dniem!');
+        return false;
+    }
     
-    let total = firstAmount + secondAmount + thirdAmount;
+    let total = amounts.reduce((sum, amount) => sum + amount, 0);
 
     if (total !== 100) {
         alert('Suma procentów musi wynosić 100%!');
         return false;
     }
 
+    let rebalance = document.querySelector('select[name="rebalance"]').value;
+    let driftThreshold = parseFloat(document.querySelector('input[name="drift_threshold"]').value) || 0;
+
+    if (rebalance === 'drift' && driftThreshold <= 0) {
+        alert('Proszę podać dopuszczalne odchylenie od docelowego udziału!');
+        return false;
+    }
+
     return true;
 }
+
+const CHART_COLORS = ['red', 'green', 'blue', 'orange', 'purple', 'brown', 'pink', 'gray', 'olive', 'cyan'];
+
+function lineChart(canvasId, title, yLabel, labels, datasets) {
+    return new Chart(document.getElementById(canvasId), {
+        type: 'line',
+        data: {labels: labels, datasets: datasets},
+        options: {
+            plugins: {title: {display: true, text: title}},
+            scales: {x: {title: {display: true, text: 'Data'}}, y: {title: {display: true, text: yLabel}}}
+        }
+    });
+}
+
+function pieChart(canvasId, title, values) {
+    return new Chart(document.getElementById(canvasId), {
+        type: 'pie',
+        data: {
+            labels: Object.keys(values),
+            datasets: [{data: Object.values(values), backgroundColor: CHART_COLORS}]
+        },
+        options: {plugins: {title: {display: true, text: title}}}
+    });
+}
+
+function drawCharts(series, horizonDays) {
+    //draw the same charts as server does, from numbers returned by /series
+    let dataset = function(code, index, values, label) {
+        return {label: label, data: values, borderColor: CHART_COLORS[index % CHART_COLORS.length], pointRadius: 2};
+    };
+
+    lineChart('investment_in_pln', 'przebieg inwestycji w PLN w ciągu inwestycji (' + horizonDays + ' dni)', 'Cena waluty', series.dates,
+        series.codes.map((code, index) => dataset(code, index, series.values[code], code + ' ' + series.percentages[index] + '%')));
+    lineChart('currency_rates', 'Cena za wybrane waluty w ciągu inwestycji (' + horizonDays + ' dni)', 'Cena waluty', series.dates,
+        series.codes.map((code, index) => dataset(code, index, series.rates[code], code)));
+    lineChart('percentage_allocation_chart', 'Procentowy udział walut w czasie', '%', series.dates,
+        series.codes.map((code, index) => dataset(code, index, series.shares[code], code)));
+
+    pieChart('pie_chart_start', 'Procentowy podział walut na początku inwestycji', series.start_pie);
+    pieChart('pie_chart_end', 'Procentowy podział walut na koniec inwestycji', series.end_pie);
+}
@@ -0,0 +1,70 @@
+"""
+Vectorised rebalancing of Portfolio compared with naive loop going day by day
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from portfolio import Portfolio
+
+WEIGHTS = np.array([0.5, 0.3, 0.2])
+DATES = [datetime(2023, 1, 4) + timedelta(days=day) for day in range(400)] #starts on Wednesday, in the middle of week and month
+
+def random_rates(seed: int) -> np.ndarray:
+    #random walk of three currencies, volatile enough to drift from target weights many times
+    rng = np.random.default_rng(seed)
+    return np.array([4.0, 4.5, 0.9]) * np.exp(np.cumsum(rng.normal(0, 0.01, (len(DATES), 3)), axis=0))
+
+def naive_portfolio(rates: np.ndarray, rebalance: str | None = None, drift_threshold: float | None = None) -> tuple[np.ndarray, list[int]]:
+    """
+    Values of each currency for each day and rebalance days, units are bought again on every rebalance day
+    """
+    def period(date: datetime) -> tuple:
+        return {'daily': (date.date(),), 'weekly': date.isocalendar()[:2], 'monthly': (date.year, date.month)}[rebalance]
+
+    units = 1000 * WEIGHTS / rates[0]
+    values = np.empty_like(rates)
+    rebalance_days = [0]
+    for day in range(len(rates)):
+        day_values = units * rates[day]
+        total = day_values.sum()
+        if rebalance is not None:
+            due = day > 0 and period(DATES[day]) != period(DATES[day - 1])
+        else:
+            due = drift_threshold is not None and np.abs(day_values / total - WEIGHTS).max() * 100 > drift_threshold
+        if due:
+            units = total * WEIGHTS / rates[day]
+            day_values = units * rates[day]
+            rebalance_days.append(day)
+        values[day] = day_values
+    return values, rebalance_days
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+@pytest.mark.parametrize('rebalance, drift_threshold', [(None, None), ('daily', None), ('weekly', None), ('monthly', None),
+                                                        (None, 1.0), (None, 2.5), (None, 10.0)])
+def test_rebalancing_matches_day_by_day_loop(seed, rebalance, drift_threshold):
+    rates = random_rates(seed)
+    portfolio = Portfolio(DATES, ['USD', 'EUR', 'CZK'], rates, WEIGHTS, 1000, rebalance, drift_threshold)
+    values, rebalance_days = naive_portfolio(rates, rebalance, drift_threshold)
+
+    assert portfolio.rebalance_days.tolist() == rebalance_days
+    np.testing.assert_allclose(portfolio.values, values, rtol=1e-12)
+    np.testing.assert_allclose(portfolio.totals, values.sum(axis=1), rtol=1e-12)
+
+def test_schedules_rebalance_on_first_day_of_period():
+    portfolio = Portfolio(DATES, ['USD', 'EUR', 'CZK'], random_rates(1), WEIGHTS, rebalance='weekly')
+    assert all(DATES[day].weekday() == 0 for day in portfolio.rebalance_days[1:])
+
+    portfolio = Portfolio(DATES, ['USD', 'EUR', 'CZK'], random_rates(1), WEIGHTS, rebalance='monthly')
+    assert all(DATES[day].day == 1 for day in portfolio.rebalance_days[1:])
+    assert len(portfolio.rebalance_days) == 14 #first day and 1st of Feb 2023 to Feb 2024
+
+def test_drift_rebalances_at_least_once():
+    portfolio = Portfolio(DATES, ['USD', 'EUR', 'CZK'], random_rates(2), WEIGHTS, drift_threshold=2.5)
+    assert len(portfolio.rebalance_days) > 2
@@ -0,0 +1,107 @@
+"""
+Forward fill of RateTable.from_rows - weekends, holiday breaks, holes in data and ranges missing from store
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from nbp_api import NbpApi
+from rate_store import RateStore
+from rate_table import RateTable
+
+def rows_for(days: list[str], code: str = 'USD') -> list[dict]:
+    #rate grows by one every published day, so it is easy to see which day was used
+    return [{'effectiveDate': day, 'code': code, 'mid': float(index + 1)} for index, day in enumerate(days)]
+
+def working_days(start: str, end: str, holidays: tuple[str, ...] = ()) -> list[str]:
+    days = []
+    current = date.fromisoformat(start)
+    while current <= date.fromisoformat(end):
+        if current.weekday() < 5 and current.isoformat() not in holidays:
+            days.append(current.isoformat())
+        current += timedelta(days=1)
+    return days
+
+def values(table: RateTable, code: str = 'USD') -> dict[str, float]:
+    return dict(zip(table.days.astype(str), table.column(code)))
+
+def test_weekend_is_filled_from_friday():
+    table = RateTable.from_rows(rows_for(working_days('2024-09-02', '2024-09-13')), '2024-09-02', '2024-09-13')
+    filled = values(table)
+
+    assert filled['2024-09-07'] == filled['2024-09-08'] == filled['2024-09-06'] #Saturday and Sunday have Friday rate
+    assert filled['2024-09-09'] == filled['2024-09-06'] + 1
+    assert not np.isnan(table.mids).any()
+
+def test_start_on_weekend_uses_rate_published_before_range():
+    rows = rows_for(working_days('2024-08-26', '2024-09-13'))
+    filled = values(RateTable.from_rows(rows, '2024-09-07', '2024-09-13'))
+
+    assert filled['2024-09-07'] == filled['2024-09-08'] == 10.0 #Friday 2024-09-06 is 10th published day
+
+def test_start_on_holiday_monday_uses_friday_rate():
+    #Easter Monday 2024-04-01, the last table before it was published on Friday 2024-03-29
+    rows = rows_for(working_days('2024-03-25', '2024-04-05', holidays=('2024-04-01',)))
+    filled = values(RateTable.from_rows(rows, '2024-04-01', '2024-04-05'))
+
+    assert filled['2024-04-01'] == 5.0
+    assert filled['2024-04-02'] == 6.0
+
+def test_christmas_break_is_filled():
+    #no tables from 24 to 28 December 2025 - the longest break in NBP publications
+    holidays = ('2025-12-24', '2025-12-25', '2025-12-26')
+    rows = rows_for(working_days('2025-12-15', '2025-12-31', holidays))
+    filled = values(RateTable.from_rows(rows, '2025-12-15', '2025-12-31'))
+
+    for day in ('2025-12-24', '2025-12-25', '2025-12-26', '2025-12-27', '2025-12-28'):
+        assert filled[day] == filled['2025-12-23']
+    assert filled['2025-12-29'] == filled['2025-12-23'] + 1
+
+def test_hole_longer_than_fill_limit_is_nan():
+    #last rate on Monday 2024-09-02, next one on Wednesday 2024-09-11 - days after MAX_FILL_DAYS stay empty
+    rows = rows_for(['2024-09-02', '2024-09-11'])
+    filled = values(RateTable.from_rows(rows, '2024-09-02', '2024-09-11'))
+
+    for day in ('2024-09-03', '2024-09-04', '2024-09-05', '2024-09-06', '2024-09-07'):
+        assert filled[day] == 1.0
+    for day in ('2024-09-08', '2024-09-09', '2024-09-10'):
+        assert np.isnan(filled[day])
+    assert filled['2024-09-11'] == 2.0
+
+def test_days_before_first_publication_are_nan():
+    filled = values(RateTable.from_rows(rows_for(['2024-09-04']), '2024-09-02', '2024-09-05'))
+
+    assert np.isnan(filled['2024-09-02']) and np.isnan(filled['2024-09-03'])
+    assert filled['2024-09-04'] == filled['2024-09-05'] == 1.0
+
+def test_missing_range_is_nan_instead_of_filled():
+    #offline mode - store has nothing from 2024-09-07, Friday rate must not be carried into it
+    rows = rows_for(working_days('2024-09-02', '2024-09-06'))
+    table = RateTable.from_rows(rows, '2024-09-02', '2024-09-13', missing_ranges=[('2024-09-07', '2024-09-13')])
+    filled = values(table)
+
+    assert filled['2024-09-06'] == 5.0
+    assert all(np.isnan(filled[day]) for day in ('2024-09-07', '2024-09-08', '2024-09-09', '2024-09-13'))
+
+def test_offline_range_missing_from_store_is_nan(tmp_path):
+    store = RateStore(str(tmp_path / 'rates.sqlite3'))
+    store.save_table_rates('A', rows_for(working_days('2024-08-26', '2024-09-06')), '2024-08-26', '2024-09-06')
+    table = NbpApi(store, offline=True).get_rate_table('2024-09-02', '2024-09-13')
+    filled = values(table)
+
+    assert filled['2024-09-06'] == 10.0
+    assert all(np.isnan(filled[day]) for day in ('2024-09-07', '2024-09-08', '2024-09-13'))
+
+def test_currency_missing_in_some_tables_is_filled_per_currency():
+    rows = rows_for(working_days('2024-09-02', '2024-09-06')) + rows_for(['2024-09-02', '2024-09-03'], code='EUR')
+    table = RateTable.from_rows(rows, '2024-09-02', '2024-09-06')
+
+    assert table.codes == ('USD', 'EUR')
+    assert values(table, 'EUR')['2024-09-06'] == 2.0
+    assert values(table, 'USD')['2024-09-06'] == 5.0
+    assert np.isnan(table.column('CHF')).all()
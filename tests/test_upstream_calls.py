@@ -0,0 +1,68 @@
+"""
+Number of HTTP requests to NBP made by one analysis, checked against local NBP stub
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.nbp_stub import start_stub
+from chart_cache import ChartCache
+from investment import Investment
+from nbp_api import NbpApi
+from rate_store import RateStore
+from rate_table import RateTable
+
+CURRENCY_DICT = {'1': {'currency': 'USD', 'percentage': '30'}, '2': {'currency': 'EUR', 'percentage': '30'},
+                 '3': {'currency': 'CHF', 'percentage': '40'}}
+
+@pytest.fixture(scope='module')
+def base_url():
+    server, url = start_stub()
+    yield url
+    server.shutdown()
+
+def make_investment(nbp_api: NbpApi, tmp_path, horizon_days: int) -> Investment:
+    investment = Investment(CURRENCY_DICT, '2024-03-04', nbp_api, ChartCache(str(tmp_path / 'charts')), horizon_days)
+    investment.rate_frame #rates are downloaded on first use
+    return investment
+
+def expected_chunks(nbp_api: NbpApi, investment: Investment) -> int:
+    #rates from MAX_FILL_DAYS before start are downloaded too
+    fill_start_date = datetime.strptime(investment.start_date, '%Y-%m-%d') - timedelta(days=RateTable.MAX_FILL_DAYS)
+    return len(nbp_api.split_range(fill_start_date.strftime('%Y-%m-%d'), investment.end_date))
+
+def test_short_analysis_makes_one_request_for_all_currencies(base_url, tmp_path):
+    nbp_api = NbpApi(base_url=base_url)
+    investment = make_investment(nbp_api, tmp_path, 30)
+
+    assert investment.upstream_calls == 1
+    assert nbp_api.request_count == 1
+
+def test_long_analysis_makes_one_request_per_chunk(base_url, tmp_path):
+    nbp_api = NbpApi(base_url=base_url)
+    investment = make_investment(nbp_api, tmp_path, 365)
+
+    assert expected_chunks(nbp_api, investment) == 4
+    assert investment.upstream_calls == 4
+
+def test_stored_rates_are_not_downloaded_again(base_url, tmp_path):
+    nbp_api = NbpApi(RateStore(str(tmp_path / 'rates.sqlite3')), base_url=base_url)
+    first = make_investment(nbp_api, tmp_path, 200)
+    second = make_investment(nbp_api, tmp_path, 200)
+
+    assert first.upstream_calls == expected_chunks(nbp_api, first)
+    assert second.upstream_calls == 0
+    assert nbp_api.request_count == first.upstream_calls
+
+def test_calls_are_counted_per_analysis(base_url, tmp_path):
+    nbp_api = NbpApi(base_url=base_url)
+    make_investment(nbp_api, tmp_path, 30)
+    investment = make_investment(nbp_api, tmp_path, 100)
+
+    assert investment.upstream_calls == expected_chunks(nbp_api, investment) == 2
+    assert nbp_api.request_count == 3
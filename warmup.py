@@ -0,0 +1,49 @@
+import logging
+import time
+from io import BytesIO
+
+from investment import load_plotting
+
+def preload_plotting() -> None:
+    """
+    Import matplotlib and draw tiny chart with text, so fonts are found (font cache is built on first run)
+    before first real chart is drawn
+    """
+    Figure, _ = load_plotting()
+    figure = Figure(figsize=(1, 1))
+    axes = figure.subplots()
+    axes.plot([0, 1], [0, 1])
+    axes.set_title('warm-up')
+    figure.savefig(BytesIO(), format='png')
+
+def warm_up(nbp_api=None, plotting: bool = True) -> dict[str, float]:
+    """
+    Prepare process before it serves requests, returns seconds spent in every step.
+    Everything runs in calling thread, so no threads are left behind for gunicorn --preload to fork,
+    and keep-alive connections to NBP are closed, so forked workers do not share sockets.
+    """
+    steps = {}
+
+    if plotting:
+        started = time.perf_counter()
+        preload_plotting()
+        steps['plotting'] = time.perf_counter() - started
+
+    if nbp_api is not None:
+        started = time.perf_counter()
+        nbp_api.warm_currency_list()
+        nbp_api.session.close() #session opens new connections on next request
+        steps['currency_list'] = time.perf_counter() - started
+
+    return steps
+
+def check_startup_budget(seconds: float, budget: float | None) -> bool:
+    """
+    Log how long startup took, warning when it took longer than budget (seconds)
+    """
+    if budget is not None and seconds > budget:
+        logging.warning(f'Startup took {seconds:.2f}s, budget is {budget:.2f}s')
+        return False
+
+    logging.info(f'Startup took {seconds:.2f}s')
+    return True